@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Dict, Iterator, List, Optional
+
+from directory_tree import DirectoryTree, CREATE, LIST, MOVE, DELETE
+from directory_tree_backend import DirectoryTreeBackend
+from directory_tree_db import DirectoryTreeDB
+from directory_tree_memory import DirectoryTreeMemory
+from instrumentation import Instrumentation
+from main import replay, SQLITE_BACKEND, MEMORY_BACKEND
+
+WIDE: str = "wide"
+DEEP: str = "deep"
+MIX: str = "mix"
+
+
+def generate_wide_tree(width: int, roots: int = 1) -> Iterator[str]:
+    for root in range(roots):
+        yield f"{CREATE} root_{root}"
+        for child in range(width):
+            yield f"{CREATE} root_{root}/folder_{child}"
+    yield LIST
+
+
+def generate_deep_chain(depth: int) -> Iterator[str]:
+    path: str = "level_0"
+    yield f"{CREATE} {path}"
+    for level in range(1, depth):
+        path = f"{path}/level_{level}"
+        yield f"{CREATE} {path}"
+    yield LIST
+
+
+def generate_random_mix(operations: int, seed: int = 0, move_ratio: float = 0.1, delete_ratio: float = 0.1,
+                        list_ratio: float = 0.0005) -> Iterator[str]:
+    # Paths are picked from the ones created so far. The generator does not track every side effect of
+    # MOVE and DELETE, so a share of commands targets missing directories and exercises the error paths.
+    generator: random.Random = random.Random(seed)
+    paths: List[str] = []
+    for operation in range(operations):
+        dice: float = generator.random()
+        if paths and dice < list_ratio:
+            yield LIST
+        elif len(paths) > 1 and dice < list_ratio + move_ratio:
+            from_path, to_path = generator.choice(paths), generator.choice(paths)
+            yield f"{MOVE} {from_path} {to_path}"
+            paths.append(f"{to_path}/{from_path.rsplit('/', 1)[-1]}")
+        elif paths and dice < list_ratio + move_ratio + delete_ratio:
+            index: int = generator.randrange(len(paths))
+            paths[index], paths[-1] = paths[-1], paths[index]
+            yield f"{DELETE} {paths.pop()}"
+        else:
+            parent: Optional[str] = generator.choice(paths) if paths and generator.random() < 0.9 else None
+            path = f"{parent}/folder_{operation}" if parent else f"folder_{operation}"
+            paths.append(path)
+            yield f"{CREATE} {path}"
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(commands: Iterator[str], database: DirectoryTreeBackend, batch_size: Optional[int] = None) -> Dict:
+    # Latencies and query counts come from Instrumentation, the same numbers --instrument reports. Every
+    # latency is kept so p50/p99 are exact and small regressions between revisions still show.
+    directory_tree: DirectoryTree = DirectoryTree(database)
+    instrumentation: Instrumentation = Instrumentation(directory_tree, samples=True).install()
+
+    started: float = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        replay(directory_tree, commands, batch_size=batch_size)
+        instrumentation.uninstall()
+        directory_tree.close()
+    elapsed: float = time.perf_counter() - started
+
+    summary: Dict = instrumentation.summary()
+    for command in summary["commands"].values():
+        command["ops_per_second"] = command["count"] / command["seconds"] if command["seconds"] else 0.0
+    total_operations: int = sum(command["count"] for command in summary["commands"].values())
+    return {
+        "operations": total_operations,
+        "seconds": elapsed,
+        "ops_per_second": total_operations / elapsed if elapsed else 0.0,
+        "queries": summary["queries"],
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "path_cache": directory_tree.path_cache.stats(),
+        "commands": summary["commands"],
+        "statements": summary["statements"],
+    }
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark directory tree command replay")
+    parser.add_argument("workload", choices=[WIDE, DEEP, MIX])
+    parser.add_argument("--size", type=int, default=10000,
+                        help="children per root (wide), chain depth (deep) or number of operations (mix)")
+    parser.add_argument("--roots", type=int, default=1, help="number of roots for the wide workload")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the mix workload")
+    parser.add_argument("--backend", choices=[SQLITE_BACKEND, MEMORY_BACKEND], default=SQLITE_BACKEND)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file instead of stdout")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    if arguments.workload == WIDE:
+        workload: Iterator[str] = generate_wide_tree(arguments.size, arguments.roots)
+    elif arguments.workload == DEEP:
+        workload = generate_deep_chain(arguments.size)
+    else:
+        workload = generate_random_mix(arguments.size, arguments.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if arguments.backend == MEMORY_BACKEND:
+            backend: DirectoryTreeBackend = DirectoryTreeMemory()
+        else:
+            backend = DirectoryTreeDB(os.path.join(directory, "benchmark.db"))
+        result: Dict = run_benchmark(workload, backend, batch_size=arguments.batch_size)
+
+    result.update({"workload": arguments.workload, "size": arguments.size, "backend": arguments.backend,
+                   "batch_size": arguments.batch_size, "revision": git_revision()})
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
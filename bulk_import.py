@@ -0,0 +1,80 @@
+import argparse
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from directory_tree_backend import DirectoryTreeBackend
+from main import create_backend, add_backend_arguments
+
+
+def read_path_list(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        path: str = "/".join(folder for folder in line.strip().split("/") if folder)
+        if path:
+            yield path
+
+
+def walk_directory(root: str) -> Iterator[str]:
+    # Yields every directory below root as a "/" separated relative path. Symbolic links are not followed.
+    pending: List[Tuple[str, str]] = [(root, "")]
+    while pending:
+        directory, relative_path = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        path: str = f"{relative_path}/{entry.name}" if relative_path else entry.name
+                        yield path
+                        pending.append((entry.path, path))
+        except PermissionError:
+            continue
+
+
+def import_paths(database: DirectoryTreeBackend, paths: Iterable[str], root: Optional[int] = None) -> int:
+    # Intermediate directories are created implicitly. Every prefix is looked up in one batched
+    # resolve_paths call, everything missing gets its id assigned in memory, and all rows are written
+    # in a single transaction. Paths are relative to root, the top level by default.
+    paths = sorted(set(paths))
+    prefixes: List[str] = sorted({path.rsplit("/", depth)[0] for path in paths for depth in range(path.count("/") + 1)})
+    existing: Dict[str, Optional[int]] = dict(zip(prefixes, database.resolve_paths(
+        [prefix.split("/") for prefix in prefixes], root)))
+    ids: Dict[str, int] = {}
+    rows: List[Tuple[int, str, Optional[int]]] = []
+    next_id: int = database.next_directory_id()
+    for path in paths:
+        prefix: str = ""
+        parent: Optional[int] = root
+        for folder in path.split("/"):
+            prefix = f"{prefix}/{folder}" if prefix else folder
+            known: Optional[int] = ids.get(prefix)
+            if known is None:
+                known = existing[prefix]
+                if known is None:
+                    known = next_id
+                    rows.append((next_id, folder, parent))
+                    next_id += 1
+                ids[prefix] = known
+            parent = known
+    return database.insert_directories(rows)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk import directories into the directory tree")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--paths", help="file with one directory path per line")
+    source.add_argument("--directory", help="existing directory to walk")
+    add_backend_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    backend: DirectoryTreeBackend = create_backend(arguments)
+    try:
+        if arguments.paths:
+            with open(arguments.paths, "r") as f:
+                imported: int = import_paths(backend, read_path_list(f))
+        else:
+            imported = import_paths(backend, walk_directory(arguments.directory))
+        print(f"Imported {imported} directories")
+    finally:
+        backend.close_db()
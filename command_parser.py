@@ -0,0 +1,69 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from directory_tree import CREATE, LIST, MOVE, DELETE
+
+PARSE_CHUNK_SIZE: int = 4096
+# Minimum and maximum number of parameters of every command.
+COMMAND_ARGUMENTS: Dict[str, Tuple[int, int]] = {
+    CREATE: (1, 1),
+    LIST: (0, 4),
+    MOVE: (2, 2),
+    DELETE: (1, 1),
+}
+
+
+class ParsedCommand(NamedTuple):
+    line_number: int
+    action: str
+    params: Tuple[str, ...]
+
+
+class InvalidCommand(NamedTuple):
+    line_number: int
+    line: str
+    reason: str
+
+
+def parse_line(line_number: int, line: str) -> Optional[Union[ParsedCommand, InvalidCommand]]:
+    arguments: List[str] = line.split()
+    if not arguments:
+        return None
+    action, params = arguments[0], tuple(arguments[1:])
+    if action not in COMMAND_ARGUMENTS:
+        return InvalidCommand(line_number, line.strip(), f"Unknown command {action}")
+    minimum, maximum = COMMAND_ARGUMENTS[action]
+    if not minimum <= len(params) <= maximum:
+        expected: str = str(minimum) if minimum == maximum else f"{minimum} to {maximum}"
+        return InvalidCommand(line_number, line.strip(), f"{action} expects {expected} argument(s)")
+    return ParsedCommand(line_number, action, params)
+
+
+def parse_chunk(lines: List[Tuple[int, str]]) -> List[Union[ParsedCommand, InvalidCommand]]:
+    return [command for command in (parse_line(line_number, line) for line_number, line in lines) if command]
+
+
+def parse_commands(lines: Iterable[str], workers: int = 0, chunk_size: int = PARSE_CHUNK_SIZE
+                   ) -> Iterator[Union[ParsedCommand, InvalidCommand]]:
+    # Yields commands in input order. With workers, chunks of lines are tokenized and validated in a
+    # process pool while earlier chunks are executed; at most 2 * workers chunks are in flight, so
+    # memory stays constant however large the input is.
+    numbered_lines: Iterator[Tuple[int, str]] = enumerate(lines, 1)
+    if workers <= 0:
+        yield from filter(None, (parse_line(line_number, line) for line_number, line in numbered_lines))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: Deque[Future] = deque()
+        exhausted: bool = False
+        while True:
+            while not exhausted and len(pending) < 2 * workers:
+                chunk: List[Tuple[int, str]] = list(islice(numbered_lines, chunk_size))
+                if chunk:
+                    pending.append(executor.submit(parse_chunk, chunk))
+                else:
+                    exhausted = True
+            if not pending:
+                return
+            yield from pending.popleft().result()
@@ -0,0 +1,71 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+
+READER_CONNECTIONS: int = 4
+CACHE_SIZE_KIB: int = 65536
+MMAP_SIZE: int = 268435456
+
+
+# Owns the single writer connection and a lazily grown pool of read-only connections. In WAL mode
+# readers work on the last committed snapshot and neither block nor get blocked by the writer, so
+# LIST and lookups can run from worker threads while mutations keep going.
+class ConnectionManager:
+
+    def __init__(self, db_name: str, readers: int = READER_CONNECTIONS) -> None:
+        self.db_name: str = db_name
+        self.max_readers: int = readers
+        self.writer: sqlite3.Connection = sqlite3.connect(db_name)
+        self.wal: bool = False
+        if db_name != ":memory:" and not db_name.startswith("file:"):
+            self.wal = self.writer.execute("""PRAGMA journal_mode=WAL""").fetchone()[0].lower() == "wal"
+        if self.wal:
+            # In WAL mode NORMAL only syncs at checkpoints, a committed transaction can be lost on power
+            # failure but never corrupts the database.
+            self.writer.execute("""PRAGMA synchronous=NORMAL""")
+        self.__configure__(self.writer)
+        self.readers: queue.LifoQueue = queue.LifoQueue()
+        self.opened: List[sqlite3.Connection] = []
+        self.lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def __configure__(connection: sqlite3.Connection) -> None:
+        connection.execute(f"""PRAGMA cache_size=-{CACHE_SIZE_KIB}""")
+        connection.execute(f"""PRAGMA mmap_size={MMAP_SIZE}""")
+
+    def __open_reader__(self) -> sqlite3.Connection:
+        connection: sqlite3.Connection = sqlite3.connect(f"{Path(self.db_name).absolute().as_uri()}?mode=ro",
+                                                         uri=True, check_same_thread=False)
+        self.__configure__(connection)
+        return connection
+
+    @property
+    def concurrent_reads(self) -> bool:
+        return self.wal and self.max_readers > 0
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        try:
+            connection: sqlite3.Connection = self.readers.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_open: bool = len(self.opened) < self.max_readers
+                if can_open:
+                    connection = self.__open_reader__()
+                    self.opened.append(connection)
+            if not can_open:
+                connection = self.readers.get()
+        try:
+            yield connection
+        finally:
+            self.readers.put(connection)
+
+    def close(self) -> None:
+        with self.lock:
+            for connection in self.opened:
+                connection.close()
+            self.opened.clear()
+        self.writer.close()
@@ -1,37 +1,66 @@
-from typing import Optional, List, Set, Tuple
+from typing import Optional, List, Tuple, Iterator, Dict, Iterable
 from utils import sanitize_upper_input
+from directory_tree_backend import DirectoryTreeBackend
 from directory_tree_db import DirectoryTreeDB
-from directory_tree_model import DirectoryModel, DirectoryTreeModel
+from directory_tree_model import DirectoryModel
+from listing_cache import ListingCache
+from path_cache import PathCache, PATH_CACHE_SIZE
 
 CREATE: str = "CREATE"
 LIST: str = "LIST"
 MOVE: str = "MOVE"
 DELETE: str = "DELETE"
 
+DEPTH: str = "depth"
+OFFSET: str = "offset"
+LIMIT: str = "limit"
+
 
 class DirectoryTree:
 
-    def __init__(self):
+    def __init__(self, database: Optional[DirectoryTreeBackend] = None, path_cache_size: int = PATH_CACHE_SIZE,
+                 incremental_list: bool = False):
         self.handlers = {
             CREATE: self.create_directory,
             LIST: self.list_directories,
             MOVE: self.move_directory,
             DELETE: self.delete_directory
         }
-        self.database = DirectoryTreeDB()
+        self.database = database if database is not None else DirectoryTreeDB()
+        self.path_cache = PathCache(path_cache_size)
+        # Only tracks changes made through this DirectoryTree, call listing_cache.clear() after writing
+        # to the backend directly.
+        self.listing_cache: Optional[ListingCache] = ListingCache() if incremental_list else None
+        self.instrumentation = None
 
     def __find_directory__(self, directory: str) -> Tuple[str, int | None]:
         folders: List[str] = sanitize_upper_input(directory).split("/")
-        parent_reference: Optional[int] = None
-        if len(folders) > 1:
-            parents: List[str] = folders[:-1]
-            for parent in parents:
-                directory: Optional[DirectoryModel] = self.database.get_directory(parent, parent_reference)
-                assert directory, f"{parent}"
-                parent_reference = directory.id
+        parents: List[str] = folders[:-1]
+        resolved, parent_reference = self.path_cache.find(parents)
+        if resolved < len(parents):
+            # Every prefix resolved on the way is cached, so siblings and shallower paths hit next time.
+            ids: List[Optional[int]] = self.database.resolve_paths(
+                [parents[resolved:depth] for depth in range(resolved + 1, len(parents) + 1)], parent_reference)
+            for depth, _id in enumerate(ids, resolved + 1):
+                assert _id is not None, f"{parents[depth - 1]}"
+                self.path_cache.put("/".join(parents[:depth]), _id)
+            parent_reference = ids[-1]
         folder_name: str = folders[-1]
         return folder_name, parent_reference
 
+    def prefetch_directories(self, directories: Iterable[str]) -> None:
+        # Resolves the parents of many paths with one batched lookup per depth and caches them, so the
+        # commands that follow find their parent in the path cache.
+        parents: Dict[str, List[str]] = {}
+        for directory in directories:
+            folders: List[str] = sanitize_upper_input(directory).split("/")[:-1]
+            path: str = "/".join(folders)
+            if folders and path not in parents and path not in self.path_cache:
+                parents[path] = folders
+        for path, _id in zip(parents, self.database.resolve_paths(list(parents.values()))):
+            if _id is not None:
+                self.path_cache.put(path, _id)
+
     def create_directory(self, directory: str) -> None:
         print(f"{CREATE} {directory}")
         try:
@@ -43,38 +72,53 @@ class DirectoryTree:
             self.database.create_directory(folder_name=folder_name, parent=parent_reference)
         except AssertionError:
             print(f"Directory {directory} already exists")
+            return
+        if self.listing_cache is not None:
+            self.listing_cache.invalidate(parent_reference)
 
-    def list_directories(self) -> None:
-        print(f"{LIST}")
-        visited_folders: Set[int] = set()
-        directory_trees: List[DirectoryTreeModel] = []
-
-        def print_directory_tree(tree, level=0):
-            if tree is not None:
-                print('  ' * level + str(tree.value))
-                if tree.children:
-                    for node in sorted(tree.children):
-                        print_directory_tree(node, level + 1)
+    def iter_list_lines(self, parent: Optional[int] = None, max_depth: Optional[int] = None, offset: int = 0,
+                        limit: Optional[int] = None) -> Iterator[str]:
+        if self.listing_cache is not None and (parent, max_depth, offset, limit) == (None, None, 0, None):
+            yield from self.listing_cache.iter_lines(self.database)
+            return
+        for level, folder_name in self.database.iter_directory_tree(parent, max_depth, offset, limit):
+            yield '  ' * level + folder_name
 
-        def find_children(directory: DirectoryModel, current_node: DirectoryTreeModel) -> Optional[DirectoryTreeModel]:
-            if not directory:
-                return None
-            children = self.database.find_children_directories(directory.id)
-            for child in children:
-                visited_folders.add(child.id)
-                child_tree: DirectoryTreeModel = find_children(child, DirectoryTreeModel(child.name))
-                if child_tree:
-                    current_node.add_child(child_tree)
-            return current_node
+    @staticmethod
+    def __list_options__(options: Tuple[str, ...]) -> Tuple[Optional[str], Dict[str, int]]:
+        directory: Optional[str] = None
+        values: Dict[str, int] = {}
+        for option in options:
+            name, separator, value = option.partition("=")
+            if not separator and directory is None:
+                directory = option
+            elif name in (DEPTH, OFFSET, LIMIT) and name not in values and value.isdigit():
+                values[name] = int(value)
+            else:
+                raise ValueError(f"invalid option {option}")
+        return directory, values
 
-        for directory_model in self.database.find_root_directories():
-            if directory_model.id not in visited_folders:
-                visited_folders.add(directory_model.id)
-                tree_model: DirectoryTreeModel = find_children(directory=directory_model,
-                                                               current_node=DirectoryTreeModel(directory_model.name))
-                directory_trees.append(tree_model)
-        for directory_tree in sorted(directory_trees):
-            print_directory_tree(directory_tree, 0)
+    def list_directories(self, *options: str) -> None:
+        # LIST [path] [depth=N] [offset=K] [limit=L] lists the children of path (the roots by default),
+        # N levels deep, starting at the K-th sorted sibling and showing at most L of them.
+        print(" ".join([LIST, *options]))
+        try:
+            directory, values = self.__list_options__(options)
+        except ValueError as e:
+            print(f"Cannot list - {e}")
+            return
+        parent: Optional[int] = None
+        if directory is not None:
+            try:
+                folder_name, parent_reference = self.__find_directory__(directory)
+                directory_model: Optional[DirectoryModel] = self.database.get_directory(folder_name, parent_reference)
+                assert directory_model, f"{folder_name}"
+            except AssertionError as e:
+                print(f"Cannot list {directory} - {e} does not exist")
+                return
+            parent = directory_model.id
+        for line in self.iter_list_lines(parent, values.get(DEPTH), values.get(OFFSET, 0), values.get(LIMIT)):
+            print(line)
 
     def delete_directory(self, directory: str) -> None:
         print(f"{DELETE} {directory}")
@@ -84,13 +128,11 @@ class DirectoryTree:
         except AssertionError as e:
             print(f"Cannot delete {directory} - {e} does not exist")
             return
-
-        def delete_children(parent_directory: DirectoryModel) -> None:
-            for child in self.database.find_children_directories(parent_directory.id):
-                self.database.direct_delete_directory(child.id)
-                delete_children(child)
-
-        delete_children(directory_model)
+        self.path_cache.invalidate(sanitize_upper_input(directory))
+        if self.listing_cache is not None:
+            self.listing_cache.invalidate(parent_reference)
+            if directory_model:
+                self.listing_cache.discard(directory_model.id)
 
     def move_directory(self, from_directory: str, to_directory: str) -> None:
         print(f"{MOVE} {from_directory} {to_directory}")
@@ -99,9 +141,23 @@ class DirectoryTree:
             to_folder_name, to_parent_reference = self.__find_directory__(to_directory)
             to_directory_model = self.database.get_directory(to_folder_name, to_parent_reference)
             assert to_directory_model, f"{to_directory}"
+            from_directory_model = self.database.get_directory(from_folder_name, from_parent_reference)
+            if from_directory_model and self.database.is_descendant(to_directory_model.id, from_directory_model.id):
+                print(f"Cannot move {from_directory} - {to_directory} is inside {from_directory}")
+                return
             self.database.update_directory_parent(from_folder_name, from_parent_reference, to_directory_model.id)
         except AssertionError as e:
             print(f'Cannot move {from_directory} - {e} does not exist')
+            return
+        self.path_cache.invalidate(sanitize_upper_input(from_directory))
+        if self.listing_cache is not None:
+            self.listing_cache.invalidate(from_parent_reference)
+            self.listing_cache.invalidate(to_directory_model.id)
+            if from_directory_model:
+                # Its cached parent link and rendering depth are stale now, re-render it on the next LIST.
+                self.listing_cache.discard(from_directory_model.id)
 
     def close(self) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.dump()
         self.database.close_db()
@@ -0,0 +1,121 @@
+from abc import ABC, abstractmethod
+from typing import Optional, List, Iterator, Tuple, Dict
+
+from directory_tree_model import DirectoryModel
+
+# What SQLite reports when a move would put two directories with the same name under one parent. Other
+# backends print the same text so every backend gives identical output.
+MOVE_CONFLICT: str = "UNIQUE constraint failed: DIRECTORY.folder_name, DIRECTORY.parent"
+
+
+# Storage interface used by DirectoryTree. Directories are identified by integer ids and looked up by
+# (folder_name, parent) pairs, where a parent of None means a root directory.
+class DirectoryTreeBackend(ABC):
+    autocommit: bool = True
+    # Whether read methods may be called from other threads while the owning thread keeps writing.
+    concurrent_reads: bool = False
+
+    @abstractmethod
+    def create_directory(self, folder_name: str, parent: Optional[int]) -> None:
+        pass
+
+    @abstractmethod
+    def insert_directories(self, rows: List[Tuple[int, str, Optional[int]]]) -> int:
+        # Inserts (id, folder_name, parent) rows with preassigned ids, parents before children. Either every
+        # row is written or none is; returns how many were written.
+        pass
+
+    @abstractmethod
+    def next_directory_id(self) -> int:
+        pass
+
+    @abstractmethod
+    def get_directory(self, folder_name: str, parent: Optional[int]) -> Optional[DirectoryModel]:
+        pass
+
+    def resolve_directory(self, folders: List[str], resolved: int = 0, parent: Optional[int] = None) -> Optional[int]:
+        # Resolves folders[resolved:] below parent and returns the id of the last one.
+        # Raises AssertionError naming the first folder that does not exist.
+        for folder in folders[resolved:]:
+            directory: Optional[DirectoryModel] = self.get_directory(folder, parent)
+            assert directory, f"{folder}"
+            parent = directory.id
+        return parent
+
+    def find_directories(self, keys: List[Tuple[Optional[int], str]]) -> Dict[Tuple[Optional[int], str], int]:
+        # Looks up many (parent, folder_name) pairs at once and maps the ones that exist to their id.
+        found: Dict[Tuple[Optional[int], str], int] = {}
+        for parent, folder_name in keys:
+            directory: Optional[DirectoryModel] = self.get_directory(folder_name, parent)
+            if directory:
+                found[(parent, folder_name)] = directory.id
+        return found
+
+    def resolve_paths(self, paths: List[List[str]], parent: Optional[int] = None) -> List[Optional[int]]:
+        # Resolves every non-empty path below parent and returns its id, or None when any folder is missing.
+        # Paths are merged into a trie of prefixes and each depth is resolved with one find_directories
+        # call, so shared prefixes are looked up once and the number of lookups grows with the depth.
+        ids: Dict[Tuple[str, ...], Optional[int]] = {(): parent}
+        for depth in range(1, max(map(len, paths), default=0) + 1):
+            keys: Dict[Tuple[str, ...], Tuple[Optional[int], str]] = {}
+            for path in paths:
+                prefix: Tuple[str, ...] = tuple(path[:depth])
+                if len(prefix) == depth and prefix not in keys and prefix[:-1] in ids:
+                    keys[prefix] = (ids[prefix[:-1]], prefix[-1])
+            if not keys:
+                break
+            found: Dict[Tuple[Optional[int], str], int] = self.find_directories(list(set(keys.values())))
+            for prefix, key in keys.items():
+                if key in found:
+                    ids[prefix] = found[key]
+        return [ids.get(tuple(path)) if path else None for path in paths]
+
+    @abstractmethod
+    def delete_directory(self, folder_name: str, parent: Optional[int]) -> DirectoryModel:
+        pass
+
+    @abstractmethod
+    def direct_delete_directory(self, _id: int) -> None:
+        pass
+
+    @abstractmethod
+    def delete_directory_tree(self, _id: int) -> None:
+        pass
+
+    @abstractmethod
+    def is_descendant(self, _id: int, ancestor: int) -> bool:
+        # True when _id is ancestor itself or lies anywhere below it.
+        pass
+
+    @abstractmethod
+    def find_children_directories(self, parent: int) -> List[DirectoryModel]:
+        pass
+
+    @abstractmethod
+    def find_children_rows(self, parent: Optional[int]) -> List[Tuple[int, str]]:
+        # (id, folder_name) of the children of parent, or of the roots for None, sorted by name.
+        pass
+
+    @abstractmethod
+    def update_directory_parent(self, folder_name: str, parent: Optional[int], new_parent: int) -> None:
+        pass
+
+    @abstractmethod
+    def find_root_directories(self) -> List[DirectoryModel]:
+        pass
+
+    @abstractmethod
+    def iter_directory_tree(self, parent: Optional[int] = None, max_depth: Optional[int] = None, offset: int = 0,
+                            limit: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        # Yields (level, folder_name) in listing order: depth first, siblings sorted by name. Level 0 holds
+        # the children of parent (the roots for None), of which only the [offset, offset + limit) window is
+        # listed, and at most max_depth levels are returned.
+        pass
+
+    @abstractmethod
+    def flush(self) -> None:
+        pass
+
+    @abstractmethod
+    def close_db(self) -> None:
+        pass
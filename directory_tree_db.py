@@ -1,35 +1,151 @@
 import sqlite3
 import os
-from typing import Optional, List, Tuple
+import threading
+from contextlib import contextmanager
+from typing import Optional, List, Tuple, Dict, Iterator
+from connection_manager import ConnectionManager, READER_CONNECTIONS
+from directory_tree_backend import DirectoryTreeBackend
 from directory_tree_model import DirectoryModel
 
+SCHEMA_VERSION: int = 1
+# Keeps a batched lookup well below SQLite's limit on bound parameters.
+MAX_LOOKUP_KEYS: int = 500
 
 
-class DirectoryTreeDB:
+class DirectoryTreeDB(DirectoryTreeBackend):
 
-    def __init__(self) -> None:
-        db_name: str = "directory_tree.db"
-        if "PYTEST_DIRECTORY_TREE" in os.environ:
-            db_name = "test_directory_tree.db"
-        self.connector = sqlite3.connect(db_name)
+    def __init__(self, db_name: Optional[str] = None, materialized_path: bool = False,
+                 readers: int = READER_CONNECTIONS) -> None:
+        if db_name is None:
+            db_name = "directory_tree.db"
+            if "PYTEST_DIRECTORY_TREE" in os.environ:
+                db_name = "test_directory_tree.db"
+        self.connections: ConnectionManager = ConnectionManager(db_name, readers)
+        self.connector = self.connections.writer
         self.cursor = self.connector.cursor()
+        self.owner_thread: int = threading.get_ident()
+        self.concurrent_reads: bool = self.connections.concurrent_reads
+        # When disabled, mutations stay in the open transaction until flush() is called.
+        self.autocommit: bool = True
+        # With a materialized path every row also stores its full "a/b/c" path, which turns path
+        # resolution, subtree listing and subtree deletion into single indexed lookups. Once a database
+        # has the column it is kept up to date whether or not the mode is requested again.
+        self.materialized_path: bool = materialized_path
         self.create_table()
 
     def create_table(self) -> None:
-        # TODO: Investigate why the unique constrain is not working in certain cases(with parent null). Will avoid a query to db.
         self.cursor.execute("""CREATE TABLE IF NOT EXISTS DIRECTORY(id INTEGER PRIMARY KEY, folder_name TEXT, parent INTEGER NULL, UNIQUE (folder_name, parent)) """)
-        self.cursor.execute("""CREATE INDEX IF NOT EXISTS index_folder_name ON DIRECTORY(folder_name)""")
+        self.migrate()
+
+    def migrate(self) -> None:
+        # Schema changes are applied in place, tracked through PRAGMA user_version.
+        version: int = self.cursor.execute("""PRAGMA user_version""").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            # UNIQUE (folder_name, parent) never matches rows whose parent is NULL, so roots get their own
+            # partial unique index. Children are looked up by parent, which needs the parent column first.
+            self.cursor.execute("""DROP INDEX IF EXISTS index_folder_name""")
+            self.cursor.execute("""CREATE INDEX IF NOT EXISTS index_parent_folder_name ON DIRECTORY(parent, folder_name)""")
+            self.__merge_duplicate_roots__()
+            self.cursor.execute("""CREATE UNIQUE INDEX IF NOT EXISTS index_root_folder_name ON DIRECTORY(folder_name) WHERE parent IS NULL""")
+            self.cursor.execute(f"""PRAGMA user_version = {SCHEMA_VERSION}""")
+        columns: List[str] = [column[1] for column in self.cursor.execute("""PRAGMA table_info(DIRECTORY)""")]
+        if "path" in columns:
+            self.materialized_path = True
+        elif self.materialized_path:
+            self.cursor.execute("""ALTER TABLE DIRECTORY ADD COLUMN path TEXT""")
+            self.cursor.execute("""WITH RECURSIVE PATHS(id, path) AS (
+                                       SELECT id, folder_name FROM DIRECTORY WHERE parent IS NULL
+                                       UNION ALL
+                                       SELECT DIRECTORY.id, PATHS.path || '/' || DIRECTORY.folder_name
+                                       FROM DIRECTORY JOIN PATHS ON DIRECTORY.parent = PATHS.id)
+                                   UPDATE DIRECTORY SET path = PATHS.path FROM PATHS WHERE PATHS.id = DIRECTORY.id""")
+            self.cursor.execute("""CREATE UNIQUE INDEX IF NOT EXISTS index_path ON DIRECTORY(path)""")
+        self.connector.commit()
+
+    def __merge_duplicate_roots__(self) -> None:
+        # Older databases could hold several roots with the same name. Each one is merged into the oldest
+        # root of that name: children are moved over, and children that collide are merged the same way.
+        merges: List[Tuple[int, int]] = self.cursor.execute("""SELECT KEEP.id, DIRECTORY.id FROM DIRECTORY
+                                                               JOIN (SELECT MIN(id) AS id, folder_name FROM DIRECTORY
+                                                                     WHERE parent IS NULL GROUP BY folder_name
+                                                                     HAVING COUNT(*) > 1) AS KEEP
+                                                               ON DIRECTORY.folder_name = KEEP.folder_name
+                                                               WHERE DIRECTORY.parent IS NULL
+                                                               AND DIRECTORY.id != KEEP.id""").fetchall()
+        while merges:
+            keep, duplicate = merges.pop()
+            for child_id, folder_name in self.cursor.execute("""SELECT id, folder_name FROM DIRECTORY WHERE parent=?""",
+                                                             (duplicate,)).fetchall():
+                existing: Optional[Tuple] = self.cursor.execute(
+                    """SELECT id FROM DIRECTORY WHERE folder_name=? AND parent=?""", (folder_name, keep)).fetchone()
+                if existing:
+                    merges.append((existing[0], child_id))
+                else:
+                    self.cursor.execute("""UPDATE DIRECTORY SET parent=? WHERE id=?""", (keep, child_id))
+            self.cursor.execute("""DELETE FROM DIRECTORY WHERE id=?""", (duplicate,))
+
+    @staticmethod
+    def __subtree_range__(path: str) -> Tuple[str, str]:
+        # Descendant paths sort strictly between "path/" and "path0", as "0" follows "/".
+        return f"{path}/", f"{path}0"
+
+    @contextmanager
+    def read_cursor(self) -> Iterator:
+        # The owning thread reads through the writer connection, so it sees its own uncommitted batch.
+        # Any other thread borrows a read-only connection and sees the last committed state.
+        if threading.get_ident() == self.owner_thread or not self.concurrent_reads:
+            yield self.cursor
+        else:
+            with self.connections.reader() as connection:
+                yield self.open_cursor(connection)
+
+    def open_cursor(self, connection: sqlite3.Connection):
+        # Every cursor besides self.cursor comes from here, so instrumentation can wrap it too.
+        return connection.cursor()
+
+    def get_directory_path(self, _id: int) -> Optional[str]:
+        with self.read_cursor() as cursor:
+            directory: Optional[Tuple] = cursor.execute("""SELECT path FROM DIRECTORY WHERE id=?""", (_id,)).fetchone()
+        return directory[0] if directory else None
 
     def create_directory(self, folder_name: str, parent: Optional[int]) -> None:
         try:
-            if not self.get_directory(folder_name, parent):
-                self.cursor.execute("""INSERT INTO DIRECTORY(folder_name, parent) VALUES(?, ?)""", (folder_name, parent))
-                self.connector.commit()
+            if self.materialized_path:
+                self.cursor.execute("""INSERT INTO DIRECTORY(folder_name, parent, path)
+                                       VALUES(?, ?, COALESCE((SELECT path FROM DIRECTORY WHERE id=?) || '/', '') || ?)
+                                       ON CONFLICT DO NOTHING""", (folder_name, parent, parent, folder_name))
             else:
+                self.cursor.execute("""INSERT INTO DIRECTORY(folder_name, parent) VALUES(?, ?) ON CONFLICT DO NOTHING""",
+                                    (folder_name, parent))
+            created: bool = self.cursor.rowcount > 0
+            self.commit()
+            if not created:
                 raise AssertionError('Folder already exists')
         except sqlite3.IntegrityError as integrity_error:
             print("Error creating directory: ", integrity_error)
 
+    def insert_directories(self, rows: List[Tuple[int, str, Optional[int]]]) -> int:
+        # The savepoint makes the import all or nothing without discarding an enclosing batch transaction.
+        self.cursor.execute("""SAVEPOINT insert_directories""")
+        inserted: int = len(rows)
+        try:
+            if self.materialized_path:
+                self.cursor.executemany("""INSERT INTO DIRECTORY(id, folder_name, parent, path)
+                                           VALUES(?1, ?2, ?3, COALESCE((SELECT path FROM DIRECTORY WHERE id=?3) || '/', '') || ?2)""",
+                                        rows)
+            else:
+                self.cursor.executemany("""INSERT INTO DIRECTORY(id, folder_name, parent) VALUES(?, ?, ?)""", rows)
+        except sqlite3.IntegrityError as integrity_error:
+            self.cursor.execute("""ROLLBACK TO insert_directories""")
+            print("Error inserting directories: ", integrity_error)
+            inserted = 0
+        self.cursor.execute("""RELEASE insert_directories""")
+        self.commit()
+        return inserted
+
+    def next_directory_id(self) -> int:
+        return self.cursor.execute("""SELECT COALESCE(MAX(id), 0) + 1 FROM DIRECTORY""").fetchone()[0]
+
     def get_directory(self, folder_name: str, parent: Optional[int]) -> Optional[DirectoryModel]:
         try:
             query = """SELECT * FROM DIRECTORY WHERE folder_name=? AND parent=?"""
@@ -37,17 +153,63 @@ class DirectoryTreeDB:
             if not parent:
                 query = """SELECT * FROM DIRECTORY WHERE folder_name=? AND parent IS NULL"""
                 params = (folder_name,)
-            directory: List = self.cursor.execute(query, params).fetchone()
+            with self.read_cursor() as cursor:
+                directory: List = cursor.execute(query, params).fetchone()
             if directory:
                 return DirectoryModel.from_db(directory)
         except sqlite3.IntegrityError as integrity_error:
             print("Error retrieving directory: ", integrity_error)
 
+    def resolve_directory(self, folders: List[str], resolved: int = 0, parent: Optional[int] = None) -> Optional[int]:
+        if self.materialized_path and resolved < len(folders):
+            with self.read_cursor() as cursor:
+                directory: Optional[Tuple] = cursor.execute("""SELECT id FROM DIRECTORY WHERE path=?""",
+                                                            ("/".join(folders),)).fetchone()
+            if directory:
+                return directory[0]
+        return super().resolve_directory(folders, resolved, parent)
+
+    def find_directories(self, keys: List[Tuple[Optional[int], str]]) -> Dict[Tuple[Optional[int], str], int]:
+        # Roots use the partial root index. The other pairs are joined against a VALUES list, which the
+        # planner turns into one (folder_name, parent) index search per pair; a row value
+        # "(parent, folder_name) IN (VALUES ...)" would scan the whole table instead.
+        found: Dict[Tuple[Optional[int], str], int] = {}
+        roots: List[str] = [folder_name for parent, folder_name in keys if not parent]
+        children: List[Tuple[int, str]] = [(parent, folder_name) for parent, folder_name in keys if parent]
+        with self.read_cursor() as cursor:
+            for start in range(0, len(roots), MAX_LOOKUP_KEYS):
+                chunk: List[str] = roots[start:start + MAX_LOOKUP_KEYS]
+                query: str = f"""SELECT id, folder_name FROM DIRECTORY
+                                 WHERE parent IS NULL AND folder_name IN ({", ".join("?" * len(chunk))})"""
+                for _id, folder_name in cursor.execute(query, chunk):
+                    found[(None, folder_name)] = _id
+            for start in range(0, len(children), MAX_LOOKUP_KEYS):
+                chunk: List[Tuple[int, str]] = children[start:start + MAX_LOOKUP_KEYS]
+                query = f"""WITH KEYS(parent, folder_name) AS (VALUES {", ".join(["(?, ?)"] * len(chunk))})
+                            SELECT DIRECTORY.id, DIRECTORY.parent, DIRECTORY.folder_name FROM KEYS
+                            JOIN DIRECTORY ON DIRECTORY.parent = KEYS.parent AND DIRECTORY.folder_name = KEYS.folder_name"""
+                for _id, parent, folder_name in cursor.execute(query, [value for key in chunk for value in key]):
+                    found[(parent, folder_name)] = _id
+        return found
+
+    def resolve_paths(self, paths: List[List[str]], parent: Optional[int] = None) -> List[Optional[int]]:
+        # With materialized paths every top level path is a single lookup on the path index.
+        if not self.materialized_path or parent is not None:
+            return super().resolve_paths(paths, parent)
+        joined: List[str] = list({"/".join(path) for path in paths if path})
+        found: Dict[str, int] = {}
+        with self.read_cursor() as cursor:
+            for start in range(0, len(joined), MAX_LOOKUP_KEYS):
+                chunk: List[str] = joined[start:start + MAX_LOOKUP_KEYS]
+                query: str = f"""SELECT path, id FROM DIRECTORY WHERE path IN ({", ".join("?" * len(chunk))})"""
+                found.update(cursor.execute(query, chunk))
+        return [found.get("/".join(path)) if path else None for path in paths]
+
     def delete_directory(self, folder_name: str, parent: Optional[int]) -> DirectoryModel:
         try:
             directory: Optional[DirectoryModel] = self.get_directory(folder_name, parent)
             assert directory, "Directory does not exist"
-            self.direct_delete_directory(directory.id)
+            self.delete_directory_tree(directory.id)
             return directory
         except sqlite3.IntegrityError as integrity_error:
             print("Error deleting directory: ", integrity_error)
@@ -55,18 +217,65 @@ class DirectoryTreeDB:
     def direct_delete_directory(self, _id: int) -> None:
         try:
             self.cursor.execute("""DELETE FROM DIRECTORY WHERE id=?""", (_id,))
-            self.connector.commit()
+            self.commit()
         except sqlite3.IntegrityError as integrity_error:
             print("Error direct deleting directory: ", integrity_error)
 
+    def delete_directory_tree(self, _id: int) -> None:
+        # Removes the directory and all of its descendants in one statement and one transaction.
+        query: str = """WITH RECURSIVE SUBTREE(id) AS (
+                            SELECT ?
+                            UNION
+                            SELECT DIRECTORY.id FROM DIRECTORY JOIN SUBTREE ON DIRECTORY.parent = SUBTREE.id)
+                         DELETE FROM DIRECTORY WHERE id IN SUBTREE"""
+        params: Tuple = (_id,)
+        path: Optional[str] = self.get_directory_path(_id) if self.materialized_path else None
+        if path is not None:
+            query = """DELETE FROM DIRECTORY WHERE path=? OR (path > ? AND path < ?)"""
+            params = (path, *self.__subtree_range__(path))
+        try:
+            self.cursor.execute(query, params)
+            self.commit()
+        except sqlite3.IntegrityError as integrity_error:
+            print("Error deleting directory tree: ", integrity_error)
+
+    def is_descendant(self, _id: int, ancestor: int) -> bool:
+        if self.materialized_path:
+            path, ancestor_path = self.get_directory_path(_id), self.get_directory_path(ancestor)
+            if path is not None and ancestor_path is not None:
+                return path == ancestor_path or path.startswith(f"{ancestor_path}/")
+        # Walks up the parent chain inside SQLite and stops as soon as the ancestor shows up.
+        # UNION, not UNION ALL, so an already corrupted cycle cannot loop forever.
+        query: str = """WITH RECURSIVE ANCESTORS(id) AS (
+                            SELECT ?
+                            UNION
+                            SELECT DIRECTORY.parent FROM DIRECTORY JOIN ANCESTORS ON DIRECTORY.id = ANCESTORS.id
+                            WHERE DIRECTORY.parent IS NOT NULL)
+                         SELECT 1 FROM ANCESTORS WHERE id=? LIMIT 1"""
+        with self.read_cursor() as cursor:
+            return cursor.execute(query, (_id, ancestor)).fetchone() is not None
+
     def find_children_directories(self, parent: int) -> List[DirectoryModel]:
         try:
-            return [DirectoryModel.from_db(values) for values in
-                    self.cursor.execute("""SELECT * FROM DIRECTORY WHERE parent=?""", (parent,)).fetchall()]
+            with self.read_cursor() as cursor:
+                return [DirectoryModel.from_db(values) for values in
+                        cursor.execute("""SELECT * FROM DIRECTORY WHERE parent=?""", (parent,)).fetchall()]
         except sqlite3.IntegrityError as integrity_error:
             print("Error deleting directory: ", integrity_error)
 
+    def find_children_rows(self, parent: Optional[int]) -> List[Tuple[int, str]]:
+        # Plain tuples straight from the cursor, already ordered by the (parent, folder_name) index.
+        try:
+            with self.read_cursor() as cursor:
+                return cursor.execute("""SELECT id, folder_name FROM DIRECTORY WHERE parent IS ? ORDER BY folder_name""",
+                                      (parent,)).fetchall()
+        except sqlite3.IntegrityError as integrity_error:
+            print("Error retrieving directories: ", integrity_error)
+
     def update_directory_parent(self, folder_name: str, parent: int, new_parent: int) -> None:
+        if self.materialized_path:
+            self.__update_directory_path__(folder_name, parent, new_parent)
+            return
         query: str = """UPDATE DIRECTORY SET parent = ? WHERE folder_name=? AND parent=?"""
         params: Tuple[int, str, Optional[int]] = (new_parent, folder_name, parent)
         if not parent:
@@ -74,18 +283,84 @@ class DirectoryTreeDB:
             params = (new_parent, folder_name)
         try:
             self.cursor.execute(query, params)
-            self.connector.commit()
+            self.commit()
+        except sqlite3.IntegrityError as integrity_error:
+            print("Error updating directory: ", integrity_error)
+
+    def __update_directory_path__(self, folder_name: str, parent: Optional[int], new_parent: int) -> None:
+        directory: Optional[DirectoryModel] = self.get_directory(folder_name, parent)
+        if not directory:
+            return
+        path: str = self.get_directory_path(directory.id)
+        new_path: str = f"{self.get_directory_path(new_parent)}/{folder_name}"
+        self.cursor.execute("""SAVEPOINT update_directory_parent""")
+        try:
+            self.cursor.execute("""UPDATE DIRECTORY SET parent = ? WHERE id=?""", (new_parent, directory.id))
+            self.cursor.execute("""UPDATE DIRECTORY SET path = ? || substr(path, ?)
+                                   WHERE path=? OR (path > ? AND path < ?)""",
+                                (new_path, len(path) + 1, path, *self.__subtree_range__(path)))
         except sqlite3.IntegrityError as integrity_error:
+            self.cursor.execute("""ROLLBACK TO update_directory_parent""")
             print("Error updating directory: ", integrity_error)
+        self.cursor.execute("""RELEASE update_directory_parent""")
+        self.commit()
 
     def find_root_directories(self) -> List[DirectoryModel]:
         try:
-            return [DirectoryModel.from_db(values) for values in
-                    self.cursor.execute("""SELECT * FROM DIRECTORY WHERE parent IS NULL""").fetchall()]
+            with self.read_cursor() as cursor:
+                return [DirectoryModel.from_db(values) for values in
+                        cursor.execute("""SELECT * FROM DIRECTORY WHERE parent IS NULL""").fetchall()]
         except sqlite3.IntegrityError as integrity_error:
             print("Error deleting directory: ", integrity_error)
 
+    def iter_directory_tree(self, parent: Optional[int] = None, max_depth: Optional[int] = None, offset: int = 0,
+                            limit: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        # Ordering the recursive queue by level descending turns the traversal depth first, and the
+        # folder_name tie-break pops siblings in sorted order, so rows come out ready to print.
+        # The sibling window and the depth limit are applied inside the query, so rows outside the
+        # requested window are never read.
+        query: str = """WITH RECURSIVE TREE(id, folder_name, level) AS (
+                            SELECT * FROM (SELECT id, folder_name, 0 FROM DIRECTORY WHERE parent IS :parent
+                                           ORDER BY folder_name LIMIT :limit OFFSET :offset)
+                            UNION ALL
+                            SELECT DIRECTORY.id, DIRECTORY.folder_name, TREE.level + 1
+                            FROM DIRECTORY JOIN TREE ON DIRECTORY.parent = TREE.id
+                            WHERE :max_depth < 0 OR TREE.level + 1 < :max_depth
+                            ORDER BY 3 DESC, 2 ASC)
+                         SELECT level, folder_name FROM TREE"""
+        params: Dict = {"parent": parent, "offset": offset, "limit": -1 if limit is None else limit,
+                        "max_depth": -1 if max_depth is None else max_depth}
+        if max_depth == 0:
+            return
+        if self.materialized_path and parent is not None and offset == 0 and limit is None:
+            path: Optional[str] = self.get_directory_path(parent)
+            if path is None:
+                return
+            # A subtree is one range on the path index. Sorting with "/" mapped below every character a
+            # name can hold puts each directory right after its parent and siblings in name order.
+            query = """SELECT length(path) - length(replace(path, '/', '')) - :depth, folder_name FROM DIRECTORY
+                       WHERE path > :start AND path < :end
+                       AND (:max_depth < 0 OR length(path) - length(replace(path, '/', '')) - :depth < :max_depth)
+                       ORDER BY replace(path, '/', char(1))"""
+            start, end = self.__subtree_range__(path)
+            params = {"depth": path.count("/") + 1, "start": start, "end": end, "max_depth": params["max_depth"]}
+        try:
+            with self.read_cursor() as cursor:
+                # The shared cursor may be reused by other calls while this stream is consumed.
+                if cursor is self.cursor:
+                    cursor = self.open_cursor(self.connector)
+                yield from cursor.execute(query, params)
+        except sqlite3.IntegrityError as integrity_error:
+            print("Error retrieving directory tree: ", integrity_error)
+
+    def commit(self) -> None:
+        if self.autocommit:
+            self.connector.commit()
+
+    def flush(self) -> None:
+        self.connector.commit()
+
     def close_db(self) -> None:
         self.connector.commit()
         self.cursor.close()
-        self.connector.close()
\ No newline at end of file
+        self.connections.close()
\ No newline at end of file
@@ -0,0 +1,225 @@
+import os
+from typing import Optional, List, Dict, Tuple, Iterator
+
+from directory_tree_backend import DirectoryTreeBackend, MOVE_CONFLICT
+from directory_tree_model import DirectoryModel
+from operation_log import (OperationLog, INSERT, DELETE, DELETE_TREE, MOVE, ID, MOVE_IDS, LOG_GROUP_SIZE,
+                           SNAPSHOT_EVERY, encode_entry, decode_entry, write_snapshot, read_snapshot)
+
+
+class DirectoryNode:
+    __slots__ = ("id", "name", "parent", "children")
+
+    def __init__(self, _id: int, name: str, parent: Optional[int]) -> None:
+        self.id: int = _id
+        self.name: str = name
+        self.parent: Optional[int] = parent
+        self.children: Dict[str, "DirectoryNode"] = {}
+
+    def to_model(self) -> DirectoryModel:
+        return DirectoryModel(id=self.id, name=self.name, parent=self.parent)
+
+
+# In-memory backend: every node keeps a dict of its children by name, so each lookup is a dict hit.
+# The tree can be saved to a snapshot file on close and is restored from it at startup. With a log_path
+# every mutation is also appended to an operation log, a snapshot is taken every snapshot_every operations
+# and the log is emptied, so recovery is the newest snapshot plus a short log tail.
+class DirectoryTreeMemory(DirectoryTreeBackend):
+
+    def __init__(self, snapshot_path: Optional[str] = None, log_path: Optional[str] = None,
+                 snapshot_every: int = SNAPSHOT_EVERY, group_size: int = LOG_GROUP_SIZE) -> None:
+        self.roots: Dict[str, DirectoryNode] = {}
+        self.nodes: Dict[int, DirectoryNode] = {}
+        self.next_id: int = 1
+        self.lsn: int = 0
+        self.autocommit: bool = True
+        self.snapshot_path: Optional[str] = snapshot_path or (f"{log_path}.snapshot" if log_path else None)
+        self.snapshot_every: int = snapshot_every
+        self.log: Optional[OperationLog] = None
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            self.restore(self.snapshot_path)
+        if log_path:
+            self.log = OperationLog(log_path, group_size)
+            for lsn, operation, arguments in self.log.read():
+                if lsn > self.lsn:
+                    self.__redo__(operation, arguments)
+            self.lsn = self.log.lsn = max(self.lsn, self.log.lsn)
+
+    def __siblings__(self, parent: Optional[int]) -> Optional[Dict[str, DirectoryNode]]:
+        if parent is None:
+            return self.roots
+        node: Optional[DirectoryNode] = self.nodes.get(parent)
+        return node.children if node else None
+
+    def __insert__(self, _id: int, folder_name: str, parent: Optional[int]) -> None:
+        node: DirectoryNode = DirectoryNode(_id, folder_name, parent)
+        self.nodes[_id] = node
+        self.__siblings__(parent)[folder_name] = node
+        self.next_id = max(self.next_id, _id + 1)
+
+    def __unlink__(self, _id: int) -> Optional[DirectoryNode]:
+        node: Optional[DirectoryNode] = self.nodes.pop(_id, None)
+        if node:
+            siblings: Optional[Dict[str, DirectoryNode]] = self.__siblings__(node.parent)
+            if siblings is not None:
+                siblings.pop(node.name, None)
+        return node
+
+    def __delete_tree__(self, _id: int) -> Optional[DirectoryNode]:
+        node: Optional[DirectoryNode] = self.__unlink__(_id)
+        pending: List[DirectoryNode] = list(node.children.values()) if node else []
+        while pending:
+            child: DirectoryNode = pending.pop()
+            self.nodes.pop(child.id, None)
+            pending.extend(child.children.values())
+        return node
+
+    def __move__(self, node: DirectoryNode, new_parent: int) -> None:
+        self.__siblings__(node.parent).pop(node.name)
+        node.parent = new_parent
+        self.__siblings__(new_parent)[node.name] = node
+
+    def __record__(self, operation: int, arguments: bytes) -> None:
+        if self.log is None:
+            return
+        self.lsn = self.log.append(operation, arguments)
+        if self.log.records >= self.snapshot_every:
+            self.snapshot()
+
+    # Applies a logged operation again while recovering, without logging it a second time.
+    def __redo__(self, operation: int, arguments: bytes) -> None:
+        if operation == INSERT:
+            _id, folder_name, parent, _ = decode_entry(arguments)
+            self.__insert__(_id, folder_name, parent)
+        elif operation == DELETE:
+            self.__unlink__(ID.unpack(arguments)[0])
+        elif operation == DELETE_TREE:
+            self.__delete_tree__(ID.unpack(arguments)[0])
+        elif operation == MOVE:
+            _id, new_parent = MOVE_IDS.unpack(arguments)
+            self.__move__(self.nodes[_id], new_parent)
+
+    def create_directory(self, folder_name: str, parent: Optional[int]) -> None:
+        siblings: Optional[Dict[str, DirectoryNode]] = self.__siblings__(parent)
+        if siblings is None:
+            print("Error creating directory: ", f"parent {parent} does not exist")
+            return
+        if folder_name in siblings:
+            raise AssertionError('Folder already exists')
+        _id: int = self.next_id
+        self.__insert__(_id, folder_name, parent)
+        self.__record__(INSERT, encode_entry(_id, folder_name, parent))
+
+    def insert_directories(self, rows: List[Tuple[int, str, Optional[int]]]) -> int:
+        next_id: int = self.next_id
+        for index, (_id, folder_name, parent) in enumerate(rows):
+            siblings: Optional[Dict[str, DirectoryNode]] = self.__siblings__(parent)
+            if siblings is None or folder_name in siblings or _id in self.nodes:
+                # Undo the rows inserted so far, children first, so nothing of the import is left.
+                for inserted_id, _, _ in reversed(rows[:index]):
+                    self.__unlink__(inserted_id)
+                self.next_id = next_id
+                print("Error inserting directories: ", f"cannot insert {folder_name} ({_id}) below {parent}")
+                return 0
+            self.__insert__(_id, folder_name, parent)
+        for _id, folder_name, parent in rows:
+            self.__record__(INSERT, encode_entry(_id, folder_name, parent))
+        return len(rows)
+
+    def next_directory_id(self) -> int:
+        return self.next_id
+
+    def get_directory(self, folder_name: str, parent: Optional[int]) -> Optional[DirectoryModel]:
+        siblings: Optional[Dict[str, DirectoryNode]] = self.__siblings__(parent)
+        if siblings and folder_name in siblings:
+            return siblings[folder_name].to_model()
+
+    def delete_directory(self, folder_name: str, parent: Optional[int]) -> DirectoryModel:
+        directory: Optional[DirectoryModel] = self.get_directory(folder_name, parent)
+        assert directory, "Directory does not exist"
+        self.delete_directory_tree(directory.id)
+        return directory
+
+    def direct_delete_directory(self, _id: int) -> None:
+        if self.__unlink__(_id):
+            self.__record__(DELETE, ID.pack(_id))
+
+    def delete_directory_tree(self, _id: int) -> None:
+        if self.__delete_tree__(_id):
+            self.__record__(DELETE_TREE, ID.pack(_id))
+
+    def is_descendant(self, _id: int, ancestor: int) -> bool:
+        node: Optional[DirectoryNode] = self.nodes.get(_id)
+        while node is not None:
+            if node.id == ancestor:
+                return True
+            node = self.nodes.get(node.parent) if node.parent is not None else None
+        return False
+
+    def find_children_directories(self, parent: int) -> List[DirectoryModel]:
+        siblings: Optional[Dict[str, DirectoryNode]] = self.__siblings__(parent)
+        return [child.to_model() for child in siblings.values()] if siblings else []
+
+    def find_children_rows(self, parent: Optional[int]) -> List[Tuple[int, str]]:
+        siblings: Optional[Dict[str, DirectoryNode]] = self.__siblings__(parent)
+        return [(siblings[name].id, name) for name in sorted(siblings)] if siblings else []
+
+    def update_directory_parent(self, folder_name: str, parent: Optional[int], new_parent: int) -> None:
+        siblings: Optional[Dict[str, DirectoryNode]] = self.__siblings__(parent)
+        new_siblings: Optional[Dict[str, DirectoryNode]] = self.__siblings__(new_parent)
+        # Moving a directory to the parent it is already in changes nothing, as with SQLite.
+        if not siblings or folder_name not in siblings or parent == new_parent:
+            return
+        if new_siblings is None or folder_name in new_siblings:
+            print("Error updating directory: ", MOVE_CONFLICT)
+            return
+        node: DirectoryNode = siblings[folder_name]
+        self.__move__(node, new_parent)
+        self.__record__(MOVE, MOVE_IDS.pack(node.id, new_parent))
+
+    def find_root_directories(self) -> List[DirectoryModel]:
+        return [root.to_model() for root in self.roots.values()]
+
+    def iter_directory_tree(self, parent: Optional[int] = None, max_depth: Optional[int] = None, offset: int = 0,
+                            limit: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        siblings: Dict[str, DirectoryNode] = self.__siblings__(parent) or {}
+        names: List[str] = sorted(siblings)[offset:None if limit is None else offset + limit]
+        pending: List[Tuple[int, DirectoryNode]] = [(0, siblings[name]) for name in reversed(names)]
+        if max_depth == 0:
+            return
+        while pending:
+            level, node = pending.pop()
+            yield level, node.name
+            if max_depth is None or level + 1 < max_depth:
+                pending.extend((level + 1, node.children[name]) for name in sorted(node.children, reverse=True))
+
+    def __preorder__(self) -> Iterator[Tuple[int, str, Optional[int]]]:
+        pending: List[DirectoryNode] = list(self.roots.values())
+        while pending:
+            node: DirectoryNode = pending.pop()
+            yield node.id, node.name, node.parent
+            pending.extend(node.children.values())
+
+    # Writes a binary snapshot (see operation_log) stamped with the last logged operation. Once the
+    # configured snapshot is on disk the log records it covers are no longer needed.
+    def snapshot(self, path: Optional[str] = None) -> None:
+        write_snapshot(path or self.snapshot_path, self.lsn, self.next_id, self.__preorder__())
+        if self.log and (path is None or path == self.snapshot_path):
+            self.log.truncate()
+
+    def restore(self, path: Optional[str] = None) -> None:
+        self.roots.clear()
+        self.nodes.clear()
+        self.next_id = 1
+        self.lsn, next_id = read_snapshot(path or self.snapshot_path, self.__insert__)
+        self.next_id = max(self.next_id, next_id)
+
+    def flush(self) -> None:
+        if self.log:
+            self.log.sync()
+
+    def close_db(self) -> None:
+        if self.snapshot_path:
+            self.snapshot()
+        if self.log:
+            self.log.close()
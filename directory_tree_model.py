@@ -3,7 +3,7 @@ from functools import total_ordering
 from typing import List
 
 
-@dataclass
+@dataclass(slots=True)
 class DirectoryModel:
     id: int
     name: str
@@ -19,6 +19,8 @@ class DirectoryModel:
 
 @total_ordering
 class DirectoryTreeModel:
+    __slots__ = ("value", "children")
+
     def __init__(self, value: str):
         self.value: str = value
         self.children: List["DirectoryTreeModel"] = []
@@ -0,0 +1,169 @@
+import json
+import signal
+import sys
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from directory_tree_db import DirectoryTreeDB
+
+
+class LatencyHistogram:
+    __slots__ = ("buckets", "count", "total", "maximum", "samples")
+
+    # Bucket i holds latencies below 2**i microseconds. With samples every latency is kept as well, so
+    # percentiles are exact instead of rounded up to a power of two.
+    def __init__(self, samples: bool = False) -> None:
+        self.buckets: List[int] = [0] * 40
+        self.count: int = 0
+        self.total: float = 0.0
+        self.maximum: float = 0.0
+        self.samples: Optional[array] = array("d") if samples else None
+
+    def add(self, seconds: float) -> None:
+        self.buckets[min(len(self.buckets) - 1, int(seconds * 1_000_000).bit_length())] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        if self.samples is not None:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> float:
+        if self.samples:
+            values: List[float] = sorted(self.samples)
+            return values[min(len(values) - 1, int(fraction * (len(values) - 1)))]
+        # Upper bound of the bucket containing the requested rank, in seconds.
+        rank: float = fraction * self.count
+        seen: int = 0
+        for bucket, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if bucket_count and seen >= rank:
+                return min(self.maximum, (1 << bucket) / 1_000_000)
+        return self.maximum
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "seconds": self.total,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.maximum * 1000,
+            "histogram_us": {f"<{1 << bucket}": bucket_count
+                             for bucket, bucket_count in enumerate(self.buckets) if bucket_count},
+        }
+
+
+class TimedCursor:
+    # Forwards to a sqlite3 cursor, timing every statement run through execute/executemany. Rows read
+    # by iterating the cursor are added to the time of the statement that produced them.
+
+    def __init__(self, cursor, statements: Dict[str, List]) -> None:
+        self.cursor = cursor
+        self.statements: Dict[str, List] = statements
+        self.statement: Optional[List] = None
+
+    def __record__(self, query: str, started: float) -> None:
+        self.statement = self.statements.setdefault(" ".join(query.split()), [0, 0.0])
+        self.statement[0] += 1
+        self.statement[1] += time.perf_counter() - started
+
+    def execute(self, query: str, *params) -> "TimedCursor":
+        started: float = time.perf_counter()
+        self.cursor.execute(query, *params)
+        self.__record__(query, started)
+        return self
+
+    def executemany(self, query: str, *params) -> "TimedCursor":
+        started: float = time.perf_counter()
+        self.cursor.executemany(query, *params)
+        self.__record__(query, started)
+        return self
+
+    def __iter__(self):
+        statement: Optional[List] = self.statement
+        rows = iter(self.cursor)
+        while True:
+            started: float = time.perf_counter()
+            row = next(rows, None)
+            if statement is not None:
+                statement[1] += time.perf_counter() - started
+            if row is None:
+                return
+            yield row
+
+    def __getattr__(self, name: str):
+        return getattr(self.cursor, name)
+
+
+# Opt-in profiling of a DirectoryTree: nothing is wrapped until install() is called, so an idle
+# instance costs nothing on the command path.
+class Instrumentation:
+
+    def __init__(self, directory_tree, output: Optional[TextIO] = None, samples: bool = False) -> None:
+        self.directory_tree = directory_tree
+        self.output: Optional[TextIO] = output
+        self.samples: bool = samples
+        self.commands: Dict[str, LatencyHistogram] = {}
+        self.command_queries: Dict[str, int] = {}
+        self.statements: Dict[str, List] = {}
+        self.query_count: int = 0
+        self.handlers: Dict[str, Callable] = {}
+
+    def __count_query__(self, statement: str) -> None:
+        self.query_count += 1
+
+    def __wrap__(self, action: str, handler: Callable) -> Callable:
+        histogram: LatencyHistogram = self.commands.setdefault(action, LatencyHistogram(self.samples))
+        self.command_queries.setdefault(action, 0)
+
+        def instrumented(*params, **options):
+            queries_before: int = self.query_count
+            started: float = time.perf_counter()
+            try:
+                return handler(*params, **options)
+            finally:
+                histogram.add(time.perf_counter() - started)
+                self.command_queries[action] += self.query_count - queries_before
+
+        return instrumented
+
+    def install(self) -> "Instrumentation":
+        self.handlers = dict(self.directory_tree.handlers)
+        for action, handler in self.handlers.items():
+            self.directory_tree.handlers[action] = self.__wrap__(action, handler)
+        database = self.directory_tree.database
+        if isinstance(database, DirectoryTreeDB):
+            database.connector.set_trace_callback(self.__count_query__)
+            database.cursor = TimedCursor(database.cursor, self.statements)
+            database.open_cursor = lambda connection: TimedCursor(connection.cursor(), self.statements)
+        self.directory_tree.instrumentation = self
+        return self
+
+    def uninstall(self) -> None:
+        self.directory_tree.handlers.update(self.handlers)
+        database = self.directory_tree.database
+        if isinstance(database, DirectoryTreeDB):
+            database.connector.set_trace_callback(None)
+            if isinstance(database.cursor, TimedCursor):
+                database.cursor = database.cursor.cursor
+            database.__dict__.pop("open_cursor", None)
+        self.directory_tree.instrumentation = None
+
+    def install_signal_handler(self, signal_number: int = signal.SIGUSR1) -> None:
+        signal.signal(signal_number, lambda received_signal, frame: self.dump())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "queries": self.query_count,
+            "commands": {action: dict(histogram.summary(), queries=self.command_queries[action])
+                         for action, histogram in self.commands.items() if histogram.count},
+            "statements": {query: {"count": count, "seconds": seconds}
+                           for query, (count, seconds) in sorted(self.statements.items(),
+                                                                 key=lambda item: -item[1][1])},
+        }
+
+    def dump(self) -> None:
+        output: TextIO = self.output or sys.stderr
+        json.dump(self.summary(), output, indent=2)
+        output.write("\n")
+        output.flush()
@@ -0,0 +1,83 @@
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from directory_tree_backend import DirectoryTreeBackend
+
+
+# Keeps the LIST rendering of every subtree between commands. A rendering is a list of lines and of
+# the (shared) renderings of the children, so rebuilding a directory reuses its clean children as they
+# are. Mutations mark only the changed directory and its ancestors dirty, and the next LIST re-queries
+# just those, costing O(depth) backend calls plus writing the output.
+# The None key stands for the forest of root directories.
+class ListingCache:
+
+    def __init__(self) -> None:
+        self.rendered: Dict[Optional[int], Tuple[int, List]] = {}
+        self.children: Dict[Optional[int], List[int]] = {}
+        self.parents: Dict[int, Optional[int]] = {}
+
+    def __rows__(self, database: DirectoryTreeBackend, _id: Optional[int]) -> List[Tuple[int, str]]:
+        rows: List[Tuple[int, str]] = database.find_children_rows(_id)
+        self.children[_id] = [child_id for child_id, _ in rows]
+        for child_id, _ in rows:
+            self.parents[child_id] = _id
+        return rows
+
+    def __build__(self, database: DirectoryTreeBackend) -> List:
+        cached: Optional[Tuple[int, List]] = self.rendered.get(None)
+        if cached is not None:
+            return cached[1]
+        # Frames are [id, depth, sorted child rows, next row, rendered parts].
+        stack: List[List] = [[None, 0, self.__rows__(database, None), 0, []]]
+        while stack:
+            frame: List = stack[-1]
+            _id, depth, rows, position, parts = frame
+            if position == len(rows):
+                stack.pop()
+                self.rendered[_id] = (depth, parts)
+                if stack:
+                    stack[-1][4].append(parts)
+                continue
+            frame[3] += 1
+            child_id, folder_name = rows[position]
+            parts.append('  ' * depth + folder_name)
+            cached = self.rendered.get(child_id)
+            if cached is not None and cached[0] == depth + 1:
+                parts.append(cached[1])
+            else:
+                stack.append([child_id, depth + 1, self.__rows__(database, child_id), 0, []])
+        return self.rendered[None][1]
+
+    def iter_lines(self, database: DirectoryTreeBackend) -> Iterator[str]:
+        pending: List[Iterator] = [iter(self.__build__(database))]
+        while pending:
+            part = next(pending[-1], None)
+            if part is None:
+                pending.pop()
+            elif isinstance(part, str):
+                yield part
+            else:
+                pending.append(iter(part))
+
+    def invalidate(self, _id: Optional[int]) -> None:
+        # Marks the directory whose children changed, and every ancestor, for re-rendering.
+        seen: Set[Optional[int]] = set()
+        while _id not in seen:
+            seen.add(_id)
+            self.rendered.pop(_id, None)
+            if _id is None:
+                return
+            _id = self.parents.get(_id)
+
+    def discard(self, _id: int) -> None:
+        # Forgets a deleted subtree, ids may be handed out again by the backend.
+        pending: List[int] = [_id]
+        while pending:
+            _id = pending.pop()
+            self.rendered.pop(_id, None)
+            self.parents.pop(_id, None)
+            pending.extend(self.children.pop(_id, []))
+
+    def clear(self) -> None:
+        self.rendered.clear()
+        self.children.clear()
+        self.parents.clear()
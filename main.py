@@ -1,15 +1,99 @@
+import argparse
+import sys
+import time
+from itertools import islice
+from typing import Iterable, Optional
 
-from directory_tree import DirectoryTree
+from command_parser import parse_commands, InvalidCommand
+from directory_tree import DirectoryTree, LIST
+from directory_tree_backend import DirectoryTreeBackend
+from directory_tree_db import DirectoryTreeDB
+from directory_tree_memory import DirectoryTreeMemory
+from instrumentation import Instrumentation
+from operation_log import SNAPSHOT_EVERY
 
+SQLITE_BACKEND: str = "sqlite"
+MEMORY_BACKEND: str = "memory"
 
-if __name__ == '__main__':
-    directory_tree = DirectoryTree()
-    with open('input.txt', 'r') as f:
-        for line in f.readlines():
-            arguments = line.strip().split()
-            action, params = arguments[0], arguments[1:]
-            directory_tree.handlers[action](*params)
-    directory_tree.close()
+
+def replay(directory_tree: DirectoryTree, lines: Iterable[str], batch_size: Optional[int] = None,
+           batch_seconds: Optional[float] = None, parse_workers: int = 0) -> None:
+    # Groups up to batch_size commands (or batch_seconds of work) in a single transaction.
+    # Whatever ran before a failing command is always committed. Malformed lines are reported on
+    # stderr and skipped. With a batch_size the parents of all paths in the next batch are resolved
+    # together before running it.
+    database = directory_tree.database
+    database.autocommit = batch_size is None and batch_seconds is None
+    pending: int = 0
+    batch_started: float = time.monotonic()
+    try:
+        commands = iter(parse_commands(lines, workers=parse_workers))
+        while chunk := list(islice(commands, batch_size or 1)):
+            if batch_size is not None:
+                directory_tree.prefetch_directories(
+                    directory for command in chunk if not isinstance(command, InvalidCommand) and command.action != LIST
+                    for directory in command.params)
+            for command in chunk:
+                if isinstance(command, InvalidCommand):
+                    print(f"Line {command.line_number}: {command.reason}: {command.line}", file=sys.stderr)
+                    continue
+                directory_tree.handlers[command.action](*command.params)
+                pending += 1
+                if (batch_size is not None and pending >= batch_size) or (
+                        batch_seconds is not None and time.monotonic() - batch_started >= batch_seconds):
+                    database.flush()
+                    pending = 0
+                    batch_started = time.monotonic()
+    finally:
+        database.flush()
+        database.autocommit = True
+
+
+def add_backend_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--backend", choices=[SQLITE_BACKEND, MEMORY_BACKEND], default=SQLITE_BACKEND,
+                        help="storage engine holding the tree")
+    parser.add_argument("--snapshot", default=None,
+                        help="snapshot file the memory backend restores from at startup and saves to on exit")
+    parser.add_argument("--log", default=None,
+                        help="operation log the memory backend appends every change to and replays at startup")
+    parser.add_argument("--snapshot-every", type=int, default=SNAPSHOT_EVERY,
+                        help="logged operations after which the memory backend writes a snapshot and empties the log")
+    parser.add_argument("--materialized-path", action="store_true",
+                        help="store the full path of every directory in the SQLite database")
 
 
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay directory tree commands")
+    parser.add_argument("input", nargs="?", default="input.txt", help="command file to replay")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="number of commands committed together in one transaction")
+    parser.add_argument("--batch-seconds", type=float, default=None,
+                        help="maximum time a transaction is kept open before committing")
+    add_backend_arguments(parser)
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="processes tokenizing and validating the input ahead of execution")
+    parser.add_argument("--incremental-list", action="store_true",
+                        help="keep LIST renderings between commands and only rebuild the changed branches")
+    parser.add_argument("--instrument", action="store_true",
+                        help="time every command and SQL statement, summary goes to stderr on exit or SIGUSR1")
+    return parser.parse_args()
 
+
+def create_backend(arguments: argparse.Namespace) -> DirectoryTreeBackend:
+    if arguments.backend == MEMORY_BACKEND:
+        return DirectoryTreeMemory(snapshot_path=arguments.snapshot, log_path=arguments.log,
+                                   snapshot_every=arguments.snapshot_every)
+    return DirectoryTreeDB(materialized_path=arguments.materialized_path)
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    directory_tree = DirectoryTree(create_backend(arguments), incremental_list=arguments.incremental_list)
+    if arguments.instrument:
+        Instrumentation(directory_tree).install().install_signal_handler()
+    try:
+        with open(arguments.input, 'r') as f:
+            replay(directory_tree, f, batch_size=arguments.batch_size, batch_seconds=arguments.batch_seconds,
+                   parse_workers=arguments.parse_workers)
+    finally:
+        directory_tree.close()
@@ -0,0 +1,135 @@
+import mmap
+import os
+import struct
+import zlib
+from typing import Optional, Callable, Iterable, Iterator, Tuple, BinaryIO
+
+INSERT: int = 1
+DELETE: int = 2
+DELETE_TREE: int = 3
+MOVE: int = 4
+
+LOG_GROUP_SIZE: int = 128
+SNAPSHOT_EVERY: int = 100000
+NO_PARENT: int = -1
+
+# Log record: payload length, crc32 of the payload, then the payload itself (lsn, operation, arguments).
+RECORD_HEADER: struct.Struct = struct.Struct("<II")
+RECORD_PREFIX: struct.Struct = struct.Struct("<qB")
+ID: struct.Struct = struct.Struct("<q")
+MOVE_IDS: struct.Struct = struct.Struct("<qq")
+
+# Snapshot: magic, lsn of the last operation included, next id, entry count, then one entry per directory.
+SNAPSHOT_MAGIC: bytes = b"DTSNAP01"
+SNAPSHOT_HEADER: struct.Struct = struct.Struct("<8sqqq")
+SNAPSHOT_ENTRY: struct.Struct = struct.Struct("<qqH")
+
+
+def encode_entry(_id: int, folder_name: str, parent: Optional[int]) -> bytes:
+    name: bytes = folder_name.encode()
+    return SNAPSHOT_ENTRY.pack(_id, NO_PARENT if parent is None else parent, len(name)) + name
+
+
+def decode_entry(buffer, offset: int = 0) -> Tuple[int, str, Optional[int], int]:
+    _id, parent, length = SNAPSHOT_ENTRY.unpack_from(buffer, offset)
+    offset += SNAPSHOT_ENTRY.size
+    name: str = bytes(buffer[offset:offset + length]).decode()
+    return _id, name, None if parent == NO_PARENT else parent, offset + length
+
+
+def sync_directory(path: str) -> None:
+    descriptor: int = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+# Entries must come parents first so restoring can insert them in file order.
+def write_snapshot(path: str, lsn: int, next_id: int, entries: Iterable[Tuple[int, str, Optional[int]]]) -> None:
+    temporary_path: str = f"{path}.tmp"
+    count: int = 0
+    with open(temporary_path, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, lsn, next_id, 0))
+        for _id, folder_name, parent in entries:
+            f.write(encode_entry(_id, folder_name, parent))
+            count += 1
+        f.seek(0)
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, lsn, next_id, count))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+    sync_directory(path)
+
+
+# Maps the snapshot and hands every entry to insert, returns (lsn, next_id) from the header.
+def read_snapshot(path: str, insert: Callable[[int, str, Optional[int]], None]) -> Tuple[int, int]:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        magic, lsn, next_id, count = SNAPSHOT_HEADER.unpack_from(view, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a directory tree snapshot")
+        offset: int = SNAPSHOT_HEADER.size
+        for _ in range(count):
+            _id, folder_name, parent, offset = decode_entry(view, offset)
+            insert(_id, folder_name, parent)
+    return lsn, next_id
+
+
+# Append-only log of the mutations applied since the last snapshot. Records are fsynced in groups of
+# group_size, or whenever sync is called, so a crash loses at most the last unsynced group.
+class OperationLog:
+
+    def __init__(self, path: str, group_size: int = LOG_GROUP_SIZE) -> None:
+        self.path: str = path
+        self.group_size: int = group_size
+        self.file: BinaryIO = open(path, "ab")
+        self.lsn: int = 0
+        self.records: int = 0
+        self.unsynced: int = 0
+
+    # Yields (lsn, operation, arguments) for every intact record and cuts off a torn tail left by a crash.
+    def read(self) -> Iterator[Tuple[int, int, bytes]]:
+        valid: int = 0
+        with open(self.path, "rb") as f:
+            data: bytes = f.read()
+        while valid + RECORD_HEADER.size <= len(data):
+            length, checksum = RECORD_HEADER.unpack_from(data, valid)
+            start: int = valid + RECORD_HEADER.size
+            payload: bytes = data[start:start + length]
+            if len(payload) < length or length < RECORD_PREFIX.size or zlib.crc32(payload) != checksum:
+                break
+            lsn, operation = RECORD_PREFIX.unpack_from(payload)
+            valid = start + length
+            self.lsn = max(self.lsn, lsn)
+            self.records += 1
+            yield lsn, operation, payload[RECORD_PREFIX.size:]
+        if valid < len(data):
+            self.file.truncate(valid)
+
+    def append(self, operation: int, arguments: bytes) -> int:
+        self.lsn += 1
+        payload: bytes = RECORD_PREFIX.pack(self.lsn, operation) + arguments
+        self.file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self.records += 1
+        self.unsynced += 1
+        if self.unsynced >= self.group_size:
+            self.sync()
+        return self.lsn
+
+    def sync(self) -> None:
+        if self.unsynced:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    # Called once a snapshot covering every record is on disk.
+    def truncate(self) -> None:
+        self.file.flush()
+        self.file.truncate(0)
+        os.fsync(self.file.fileno())
+        self.records = 0
+        self.unsynced = 0
+
+    def close(self) -> None:
+        self.sync()
+        self.file.close()
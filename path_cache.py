@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+PATH_CACHE_SIZE: int = 65536
+
+
+# Bounded LRU mapping of full directory paths ("a/b/c") to directory ids. A prefix index maps every
+# cached path, and every prefix of one, to the paths one level below it, so invalidating a path only
+# visits the cached entries inside it.
+class PathCache:
+
+    def __init__(self, max_size: int = PATH_CACHE_SIZE) -> None:
+        self.max_size: int = max_size
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.children: Dict[str, Set[str]] = {"": set()}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def find(self, folders: List[str]) -> Tuple[int, Optional[int]]:
+        # Returns how many leading folders were resolved from the cache and the id of the deepest one.
+        # A lookup is a hit only when the whole path was cached, otherwise the caller still goes to the database.
+        for depth in range(len(folders), 0, -1):
+            path: str = "/".join(folders[:depth])
+            _id: Optional[int] = self.entries.get(path)
+            if _id is not None:
+                self.entries.move_to_end(path)
+                if depth == len(folders):
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                return depth, _id
+        if folders:
+            self.misses += 1
+        return 0, None
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.entries
+
+    def __link__(self, path: str) -> None:
+        missing: List[str] = []
+        while path not in self.children:
+            missing.append(path)
+            path = path.rpartition("/")[0]
+        for child in reversed(missing):
+            self.children[child] = set()
+            self.children[child.rpartition("/")[0]].add(child)
+
+    def __prune__(self, path: str) -> None:
+        # Drops path and its ancestors from the index while nothing is cached at or below them.
+        while path and path not in self.entries and not self.children[path]:
+            del self.children[path]
+            parent: str = path.rpartition("/")[0]
+            self.children[parent].discard(path)
+            path = parent
+
+    def put(self, path: str, _id: int) -> None:
+        self.entries[path] = _id
+        self.entries.move_to_end(path)
+        self.__link__(path)
+        if len(self.entries) > self.max_size:
+            evicted, _ = self.entries.popitem(last=False)
+            self.__prune__(evicted)
+
+    def invalidate(self, path: str) -> None:
+        if not path or path not in self.children:
+            return
+        pending: List[str] = [path]
+        while pending:
+            key: str = pending.pop()
+            pending.extend(self.children.pop(key))
+            self.entries.pop(key, None)
+        parent: str = path.rpartition("/")[0]
+        self.children[parent].discard(path)
+        self.__prune__(parent)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.children = {"": set()}
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
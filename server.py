@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import signal
+from contextlib import redirect_stdout
+from io import StringIO
+from itertools import chain, islice
+from typing import List, Optional, Tuple, Callable, Iterator, Dict
+
+from command_parser import parse_line, InvalidCommand
+from directory_tree import DirectoryTree, LIST
+from main import create_backend, add_backend_arguments
+
+MAX_WRITE_BATCH: int = 1000
+
+
+# Serves DirectoryTree commands over a line protocol: one command per line, and each response is the
+# command output followed by an empty line. Clients may pipeline, responses come back in request order.
+# Mutations from every client go through a single writer task and are committed in groups. LIST goes
+# through the same queue, so it sees exactly the commands sent before it, and is answered from a
+# rendering shared by all readers until the next group of mutations lands.
+class DirectoryTreeServer:
+
+    def __init__(self, directory_tree: DirectoryTree) -> None:
+        self.directory_tree: DirectoryTree = directory_tree
+        self.mutations: asyncio.Queue = asyncio.Queue()
+        self.version: int = 0
+        self.rendering: Optional[Tuple[int, asyncio.Future]] = None
+        self.writer_task: Optional[asyncio.Task] = None
+        self.clients: Dict[asyncio.StreamReader, asyncio.Task] = {}
+
+    def execute(self, action: str, params: Tuple[str, ...]) -> str:
+        output: StringIO = StringIO()
+        with redirect_stdout(output):
+            try:
+                self.directory_tree.handlers[action](*params)
+            except Exception as error:
+                print(f"Error executing {action}: {error}")
+        return output.getvalue()
+
+    def commit_group(self, group: List[Tuple[asyncio.Future, str]]) -> None:
+        if not group:
+            return
+        self.directory_tree.database.flush()
+        self.version += 1
+        for future, result in group:
+            if not future.cancelled():
+                future.set_result(result)
+
+    async def apply_mutations(self) -> None:
+        self.directory_tree.database.autocommit = False
+        while True:
+            batch: List[Tuple[str, Tuple[str, ...], asyncio.Future]] = [await self.mutations.get()]
+            while len(batch) < MAX_WRITE_BATCH and not self.mutations.empty():
+                batch.append(self.mutations.get_nowait())
+            group: List[Tuple[asyncio.Future, str]] = []
+            for action, params, future in batch:
+                if action == LIST and not params:
+                    # Everything queued before the LIST is committed, and the writer only goes on once the
+                    # rendering has pinned that state.
+                    self.commit_group(group)
+                    group = []
+                    rendering: asyncio.Future = await self.render_snapshot()
+                    if not future.cancelled():
+                        future.set_result(rendering)
+                else:
+                    group.append((future, self.execute(action, params)))
+            self.commit_group(group)
+
+    def render_list(self, started: Optional[Callable[[], None]] = None) -> str:
+        lines: Iterator[str] = self.directory_tree.iter_list_lines()
+        try:
+            # Stepping the query once opens its read transaction, which fixes the state being rendered.
+            first: List[str] = list(islice(lines, 1))
+        finally:
+            if started is not None:
+                started()
+        rendered: str = "".join(f"{line}\n" for line in chain(first, lines))
+        return f"{LIST}\n{rendered}"
+
+    async def render_snapshot(self) -> asyncio.Future:
+        # Returns the rendering of the current version, shared by every LIST until the next commit. Backends
+        # with a read connection pool render in a worker thread from the last commit; this returns as soon
+        # as that thread has opened its read transaction.
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        version: int = self.version
+        if self.rendering is not None and self.rendering[0] == version:
+            return self.rendering[1]
+        if self.directory_tree.database.concurrent_reads and self.directory_tree.listing_cache is None:
+            started: asyncio.Future = loop.create_future()
+            rendered: asyncio.Future = loop.run_in_executor(
+                None, self.render_list, lambda: loop.call_soon_threadsafe(started.set_result, None))
+            await started
+        else:
+            rendered = loop.create_future()
+            rendered.set_result(self.render_list())
+        self.rendering = (version, rendered)
+        return rendered
+
+    @staticmethod
+    async def list_directories(listed: asyncio.Future) -> str:
+        return await (await listed)
+
+    async def send_responses(self, responses: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        while (response := await responses.get()) is not None:
+            writer.write((await response).encode() + b"\n")
+            await writer.drain()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.clients[reader] = asyncio.current_task()
+        responses: asyncio.Queue = asyncio.Queue()
+        sender: asyncio.Task = asyncio.create_task(self.send_responses(responses, writer))
+        try:
+            async for line in reader:
+                command = parse_line(0, line.decode())
+                if command is None:
+                    continue
+                if isinstance(command, InvalidCommand):
+                    invalid: asyncio.Future = asyncio.get_running_loop().create_future()
+                    invalid.set_result(f"{command.reason}\n")
+                    await responses.put(invalid)
+                    continue
+                queued: asyncio.Future = asyncio.get_running_loop().create_future()
+                await self.mutations.put((command.action, command.params, queued))
+                if command.action == LIST and not command.params:
+                    await responses.put(asyncio.ensure_future(self.list_directories(queued)))
+                else:
+                    await responses.put(queued)
+            await responses.put(None)
+            await sender
+        except (ConnectionError, asyncio.CancelledError):
+            sender.cancel()
+        finally:
+            self.clients.pop(reader, None)
+            writer.close()
+
+    async def start(self, socket_path: Optional[str] = None, host: str = "127.0.0.1",
+                    port: Optional[int] = None) -> asyncio.AbstractServer:
+        self.writer_task = asyncio.create_task(self.apply_mutations())
+        if socket_path:
+            return await asyncio.start_unix_server(self.handle_client, path=socket_path)
+        return await asyncio.start_server(self.handle_client, host=host, port=port)
+
+    async def stop(self, server: asyncio.AbstractServer) -> None:
+        # Clients still connected stop being read, get the responses already queued for them and are closed.
+        server.close()
+        for reader in self.clients:
+            reader.feed_eof()
+        await asyncio.gather(*self.clients.values(), return_exceptions=True)
+        await server.wait_closed()
+        while not self.mutations.empty():
+            await asyncio.sleep(0)
+        if self.writer_task:
+            self.writer_task.cancel()
+        self.directory_tree.database.flush()
+        self.directory_tree.database.autocommit = True
+
+
+async def serve(directory_tree: DirectoryTree, socket_path: Optional[str], host: str, port: Optional[int]) -> None:
+    directory_tree_server: DirectoryTreeServer = DirectoryTreeServer(directory_tree)
+    server: asyncio.AbstractServer = await directory_tree_server.start(socket_path, host, port)
+    stopped: asyncio.Event = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signal_number, stopped.set)
+    await stopped.wait()
+    await directory_tree_server.stop(server)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve directory tree commands over a socket")
+    parser.add_argument("--socket", default=None, help="Unix domain socket path to listen on")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port used when no socket is given")
+    add_backend_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    directory_tree = DirectoryTree(create_backend(arguments))
+    try:
+        asyncio.run(serve(directory_tree, arguments.socket, arguments.host, arguments.port))
+    finally:
+        directory_tree.close()
@@ -0,0 +1,274 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import zlib
+from contextlib import redirect_stdout
+from io import StringIO
+from typing import Optional, List, Dict, Tuple, Iterable, Any
+
+from bulk_import import import_paths
+from command_parser import parse_commands, InvalidCommand
+from directory_tree import DirectoryTree, LIST, MOVE, DEPTH, OFFSET, LIMIT
+from directory_tree_backend import MOVE_CONFLICT
+from directory_tree_db import DirectoryTreeDB
+from utils import sanitize_upper_input
+
+SHARD_BATCH_SIZE: int = 256
+MAX_IN_FLIGHT: int = 4
+
+
+# One partition of the tree: every root routed to this shard and everything below it, in its own
+# database. Runs inside a worker process and only sees the commands the coordinator sends it.
+class Shard:
+
+    def __init__(self, db_name: str, materialized_path: bool = False) -> None:
+        self.database: DirectoryTreeDB = DirectoryTreeDB(db_name, materialized_path=materialized_path, readers=0)
+        self.database.autocommit = False
+        self.directory_tree: DirectoryTree = DirectoryTree(self.database)
+
+    # Runs a batch of (sequence, action, params) commands in one transaction, returns their output.
+    def execute(self, commands: List[Tuple[int, str, Tuple[str, ...]]]) -> List[Tuple[int, str]]:
+        outputs: List[Tuple[int, str]] = []
+        for sequence, action, params in commands:
+            output: StringIO = StringIO()
+            with redirect_stdout(output):
+                try:
+                    self.directory_tree.handlers[action](*params)
+                except Exception as error:
+                    print(f"Error executing {action}: {error}")
+            outputs.append((sequence, output.getvalue()))
+        self.database.flush()
+        return outputs
+
+    # Returns (missing folder, None) when a parent is missing, otherwise (None, id or None).
+    def locate(self, directory: str) -> Tuple[Optional[str], Optional[int]]:
+        folders: List[str] = sanitize_upper_input(directory).split("/")
+        try:
+            parent: Optional[int] = self.database.resolve_directory(folders[:-1])
+        except AssertionError as e:
+            return f"{e}", None
+        directory_model = self.database.get_directory(folders[-1], parent)
+        return None, directory_model.id if directory_model else None
+
+    # Every root with its subtree rendered as LIST lines, as (root name, lines) in sorted order.
+    def list_blocks(self, max_depth: Optional[int]) -> List[Tuple[str, List[str]]]:
+        blocks: List[Tuple[str, List[str]]] = []
+        for level, folder_name in self.database.iter_directory_tree(None, max_depth):
+            if level == 0:
+                blocks.append((folder_name, []))
+            blocks[-1][1].append('  ' * level + folder_name)
+        return blocks
+
+    # Removes the directory and returns its subtree as paths relative to its parent.
+    def export(self, directory: str) -> List[str]:
+        _, _id = self.locate(directory)
+        paths: List[str] = []
+        prefix: List[str] = [sanitize_upper_input(directory).split("/")[-1]]
+        paths.append(prefix[0])
+        for level, folder_name in self.database.iter_directory_tree(_id):
+            del prefix[level + 1:]
+            prefix.append(folder_name)
+            paths.append("/".join(prefix))
+        with redirect_stdout(StringIO()):
+            self.directory_tree.delete_directory(directory)
+        self.database.flush()
+        return paths
+
+    def adopt(self, parent: int, paths: List[str]) -> int:
+        imported: int = import_paths(self.database, paths, root=parent)
+        self.database.flush()
+        return imported
+
+    def close(self) -> None:
+        self.directory_tree.close()
+
+
+def run_shard(db_name: str, materialized_path: bool, requests: multiprocessing.Queue,
+              results: multiprocessing.Queue) -> None:
+    shard: Shard = Shard(db_name, materialized_path)
+    try:
+        while (request := requests.get()) is not None:
+            tag, method, args = request
+            results.put((tag, getattr(shard, method)(*args)))
+    finally:
+        shard.close()
+
+
+# Splits a command stream by root directory over one process per shard. Roots never interact except
+# through MOVE, so every command is sent to the shard owning the root of its path and the shards run
+# in parallel. A MOVE between shards is carried out here by exporting the subtree from one shard and
+# importing it into the other, and a LIST of the whole tree merges the roots of every shard. Output is
+# written in input order.
+class ShardCoordinator:
+
+    def __init__(self, shards: int, db_prefix: str = "directory_tree", materialized_path: bool = False,
+                 batch_size: int = SHARD_BATCH_SIZE) -> None:
+        self.shards: int = shards
+        self.batch_size: int = batch_size
+        self.requests: List[multiprocessing.Queue] = [multiprocessing.Queue() for _ in range(shards)]
+        self.results: multiprocessing.Queue = multiprocessing.Queue()
+        self.processes: List[multiprocessing.Process] = [
+            multiprocessing.Process(target=run_shard, daemon=True,
+                                    args=(f"{db_prefix}.shard{index}.db", materialized_path, self.requests[index],
+                                          self.results))
+            for index in range(shards)]
+        for process in self.processes:
+            process.start()
+        self.pending: List[List[Tuple[int, str, Tuple[str, ...]]]] = [[] for _ in range(shards)]
+        self.in_flight: List[int] = [0] * shards
+        self.batches: Dict[int, int] = {}
+        self.replies: Dict[int, Any] = {}
+        self.outputs: Dict[int, str] = {}
+        self.next_tag: int = 0
+        self.sequence: int = 0
+        self.written: int = 0
+
+    def shard_of(self, directory: str) -> int:
+        root: str = sanitize_upper_input(directory).split("/", 1)[0]
+        return zlib.crc32(root.encode()) % self.shards
+
+    def __send__(self, shard: int, method: str, *args: Any) -> int:
+        tag: int = self.next_tag
+        self.next_tag += 1
+        self.requests[shard].put((tag, method, args))
+        return tag
+
+    def __receive__(self) -> None:
+        tag, value = self.results.get()
+        shard: Optional[int] = self.batches.pop(tag, None)
+        if shard is None:
+            self.replies[tag] = value
+            return
+        self.in_flight[shard] -= 1
+        self.outputs.update(value)
+
+    def __dispatch__(self, shard: int) -> None:
+        if self.pending[shard]:
+            self.batches[self.__send__(shard, "execute", self.pending[shard])] = shard
+            self.pending[shard] = []
+            self.in_flight[shard] += 1
+        while self.in_flight[shard] > MAX_IN_FLIGHT:
+            self.__receive__()
+
+    def __wait__(self, tag: int) -> Any:
+        while tag not in self.replies:
+            self.__receive__()
+        return self.replies.pop(tag)
+
+    # Runs method on a shard after every command queued for it so far.
+    def call(self, shard: int, method: str, *args: Any) -> Any:
+        self.__dispatch__(shard)
+        return self.__wait__(self.__send__(shard, method, *args))
+
+    def execute(self, action: str, params: Tuple[str, ...]) -> None:
+        sequence: int = self.sequence
+        self.sequence += 1
+        directory: Optional[str] = params[0] if params else None
+        if action == LIST:
+            try:
+                directory, values = DirectoryTree.__list_options__(params)
+            except ValueError:
+                directory = None
+            else:
+                if directory is None:
+                    self.outputs[sequence] = self.list_directories(params, values)
+                    return
+        if action == MOVE and self.shard_of(params[0]) != self.shard_of(params[1]):
+            self.outputs[sequence] = self.move_directory(*params)
+            return
+        shard: int = self.shard_of(directory) if directory is not None else 0
+        self.pending[shard].append((sequence, action, params))
+        if len(self.pending[shard]) >= self.batch_size:
+            self.__dispatch__(shard)
+
+    def list_directories(self, options: Tuple[str, ...], values: Dict[str, int]) -> str:
+        for shard in range(self.shards):
+            self.__dispatch__(shard)
+        tags: List[int] = [self.__send__(shard, "list_blocks", values.get(DEPTH)) for shard in range(self.shards)]
+        blocks: List[Tuple[str, List[str]]] = sorted(block for tag in tags for block in self.__wait__(tag))
+        offset: int = values.get(OFFSET, 0)
+        limit: Optional[int] = values.get(LIMIT)
+        lines: List[str] = [" ".join([LIST, *options])]
+        for _, block in blocks[offset:None if limit is None else offset + limit]:
+            lines.extend(block)
+        return "\n".join(lines) + "\n"
+
+    def move_directory(self, from_directory: str, to_directory: str) -> str:
+        # Same checks, in the same order, as DirectoryTree.move_directory. A root in one shard can never
+        # be inside a root of another one, so there is no cycle to look for.
+        source: int = self.shard_of(from_directory)
+        target: int = self.shard_of(to_directory)
+        header: str = f"{MOVE} {from_directory} {to_directory}\n"
+        missing, from_id = self.call(source, "locate", from_directory)
+        if missing is None:
+            missing, to_id = self.call(target, "locate", to_directory)
+            if missing is None and to_id is None:
+                missing = to_directory
+        if missing is not None:
+            return f"{header}Cannot move {from_directory} - {missing} does not exist\n"
+        if from_id is None:
+            return header
+        folder_name: str = sanitize_upper_input(from_directory).split("/")[-1]
+        _, existing = self.call(target, "locate", f"{sanitize_upper_input(to_directory)}/{folder_name}")
+        if existing is not None:
+            return f"{header}Error updating directory:  {MOVE_CONFLICT}\n"
+        self.call(target, "adopt", to_id, self.call(source, "export", from_directory))
+        return header
+
+    def write_outputs(self) -> None:
+        while self.written in self.outputs:
+            sys.stdout.write(self.outputs.pop(self.written))
+            self.written += 1
+
+    # Waits for every shard to finish the commands sent so far.
+    def drain(self) -> None:
+        for shard in range(self.shards):
+            self.__dispatch__(shard)
+        while self.batches:
+            self.__receive__()
+        self.write_outputs()
+
+    def close(self) -> None:
+        self.drain()
+        for requests in self.requests:
+            requests.put(None)
+        for process in self.processes:
+            process.join()
+
+
+def replay_sharded(coordinator: ShardCoordinator, lines: Iterable[str], parse_workers: int = 0) -> None:
+    for command in parse_commands(lines, workers=parse_workers):
+        if isinstance(command, InvalidCommand):
+            print(f"Line {command.line_number}: {command.reason}: {command.line}", file=sys.stderr)
+            continue
+        coordinator.execute(command.action, command.params)
+        coordinator.write_outputs()
+    coordinator.drain()
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay directory tree commands on one process per root shard")
+    parser.add_argument("input", nargs="?", default="input.txt", help="command file to replay")
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1,
+                        help="number of shard processes, a shard set must always be reopened with the same number")
+    parser.add_argument("--database-prefix", default="directory_tree",
+                        help="shard databases are named PREFIX.shardN.db")
+    parser.add_argument("--batch-size", type=int, default=SHARD_BATCH_SIZE,
+                        help="commands sent to a shard and committed there together")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="processes tokenizing and validating the input ahead of execution")
+    parser.add_argument("--materialized-path", action="store_true",
+                        help="store the full path of every directory in the shard databases")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    coordinator = ShardCoordinator(arguments.shards, arguments.database_prefix, arguments.materialized_path,
+                                   arguments.batch_size)
+    try:
+        with open(arguments.input, "r") as f:
+            replay_sharded(coordinator, f, arguments.parse_workers)
+    finally:
+        coordinator.close()
@@ -1,9 +1,37 @@
 from io import StringIO
 import unittest.mock
+import asyncio
+import json
+import concurrent.futures
+import sqlite3
+import tempfile
 import os
 
 from directory_tree import DirectoryTree
-from directory_tree_db import DirectoryTreeDB
+from directory_tree_db import DirectoryTreeDB, SCHEMA_VERSION
+from directory_tree_memory import DirectoryTreeMemory
+from directory_tree_model import DirectoryModel, DirectoryTreeModel
+from path_cache import PathCache
+from main import replay
+from command_parser import parse_line, parse_commands, ParsedCommand, InvalidCommand
+from bulk_import import import_paths, read_path_list, walk_directory
+from instrumentation import Instrumentation, LatencyHistogram, TimedCursor
+from server import DirectoryTreeServer
+from sharding import ShardCoordinator, replay_sharded
+from benchmark import generate_wide_tree, generate_deep_chain, generate_random_mix, run_benchmark
+
+
+def remove_database(db_name):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_name + suffix):
+            os.remove(db_name + suffix)
+
+
+def close_quietly(close):
+    try:
+        close()
+    except sqlite3.ProgrammingError:
+        pass
 
 
 class MainTest(unittest.TestCase):
@@ -67,8 +95,7 @@ foods
         os.environ["PYTEST_DIRECTORY_TREE"] = "True"
 
     def tearDown(self):
-        if os.path.exists(self.db_name):
-            os.remove(self.db_name)
+        remove_database(self.db_name)
 
     @unittest.mock.patch('sys.stdout', new_callable=StringIO)
     def test_basic(self, mock_stdout):
@@ -83,6 +110,71 @@ foods
 
         assert mock_stdout.getvalue().strip() == self.expected_output.strip()
 
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_memory_backend(self, mock_stdout):
+        directory_tree = DirectoryTree(DirectoryTreeMemory())
+        replay(directory_tree, self.input_value.split('\n'))
+        directory_tree.close()
+
+        assert mock_stdout.getvalue().strip() == self.expected_output.strip()
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_materialized_path(self, mock_stdout):
+        directory_tree = DirectoryTree(DirectoryTreeDB(materialized_path=True))
+        replay(directory_tree, self.input_value.split('\n'))
+        directory_tree.close()
+
+        assert mock_stdout.getvalue().strip() == self.expected_output.strip()
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_incremental_list(self, mock_stdout):
+        directory_tree = DirectoryTree(incremental_list=True)
+        replay(directory_tree, self.input_value.split('\n'))
+        directory_tree.close()
+
+        assert mock_stdout.getvalue().strip() == self.expected_output.strip()
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_batch_replay(self, mock_stdout):
+        directory_tree = DirectoryTree()
+        replay(directory_tree, self.input_value.split('\n'), batch_size=4)
+        directory_tree.close()
+
+        assert mock_stdout.getvalue().strip() == self.expected_output.strip()
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_batch_replay_failure_keeps_previous_commands(self, mock_stdout):
+        directory_tree = DirectoryTree()
+        directory_tree.handlers["DELETE"] = unittest.mock.Mock(side_effect=RuntimeError("disk full"))
+        with self.assertRaises(RuntimeError):
+            replay(directory_tree, ["CREATE fruits", "CREATE vegetables", "DELETE fruits", "CREATE grains"],
+                   batch_size=10)
+        directory_tree.database.connector.rollback()
+        assert len(directory_tree.database.find_root_directories()) == 2
+        directory_tree.close()
+
+    @unittest.mock.patch('sys.stderr', new_callable=StringIO)
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_replay_skips_invalid_lines(self, mock_stdout, mock_stderr):
+        directory_tree = DirectoryTree()
+        replay(directory_tree, ["CREATE fruits", "RENAME fruits", "MOVE fruits", "CREATE", "LIST"])
+        directory_tree.close()
+
+        assert mock_stdout.getvalue() == "CREATE fruits\nLIST\nfruits\n"
+        assert mock_stderr.getvalue().splitlines() == [
+            "Line 2: Unknown command RENAME: RENAME fruits",
+            "Line 3: MOVE expects 2 argument(s): MOVE fruits",
+            "Line 4: CREATE expects 1 argument(s): CREATE",
+        ]
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_parallel_parsing(self, mock_stdout):
+        directory_tree = DirectoryTree()
+        replay(directory_tree, self.input_value.split('\n'), parse_workers=2)
+        directory_tree.close()
+
+        assert mock_stdout.getvalue().strip() == self.expected_output.strip()
+
 
 class DtDbFunctionalityTest(unittest.TestCase):
     def setUp(self):
@@ -91,8 +183,18 @@ class DtDbFunctionalityTest(unittest.TestCase):
         self.directory_db = DirectoryTreeDB()
 
     def tearDown(self):
-        if os.path.exists(self.db_name):
-            os.remove(self.db_name)
+        close_quietly(self.directory_db.close_db)
+        remove_database(self.db_name)
+
+    def test_resolve_paths_queries(self):
+        self.directory_db.insert_directories([(1, "Test", None), (2, "Test_2", 1)] +
+                                             [(3 + index, f"Test_{index}", 2) for index in range(1200)])
+        queries = []
+        self.directory_db.connector.set_trace_callback(queries.append)
+
+        ids = self.directory_db.resolve_paths([["Test", "Test_2", f"Test_{index}"] for index in range(1300)])
+        assert ids == list(range(3, 1203)) + [None] * 100
+        assert len(queries) == 2 + 3
 
     def test_create_table(self):
         self.directory_db.create_table()
@@ -103,6 +205,46 @@ class DtDbFunctionalityTest(unittest.TestCase):
         self.directory_db.create_table()
         assert len(tables) == 1, "Duplicate table created"
 
+    def test_migrate_existing_database(self):
+        self.directory_db.close_db()
+        os.remove(self.db_name)
+        connector = sqlite3.connect(self.db_name)
+        connector.execute("""CREATE TABLE DIRECTORY(id INTEGER PRIMARY KEY, folder_name TEXT, parent INTEGER NULL, UNIQUE (folder_name, parent))""")
+        connector.execute("""CREATE INDEX index_folder_name ON DIRECTORY(folder_name)""")
+        connector.execute("""INSERT INTO DIRECTORY(folder_name, parent) VALUES ('Test', NULL), ('Test_2', 1)""")
+        connector.commit()
+        connector.close()
+
+        self.directory_db = DirectoryTreeDB()
+        assert self.directory_db.cursor.execute("""PRAGMA user_version""").fetchone()[0] == SCHEMA_VERSION
+        indexes = {row[0] for row in self.directory_db.cursor.execute(
+            """SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='DIRECTORY'""")}
+        assert "index_folder_name" not in indexes
+        assert {"index_parent_folder_name", "index_root_folder_name"} <= indexes
+        assert self.directory_db.get_directory("Test_2", 1)
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_migrate_duplicate_roots(self, mock_stdout):
+        self.directory_db.close_db()
+        os.remove(self.db_name)
+        connector = sqlite3.connect(self.db_name)
+        connector.execute("""CREATE TABLE DIRECTORY(id INTEGER PRIMARY KEY, folder_name TEXT, parent INTEGER NULL, UNIQUE (folder_name, parent))""")
+        connector.execute("""INSERT INTO DIRECTORY(id, folder_name, parent) VALUES (1, 'Test', NULL), (2, 'Test', NULL),
+                             (3, 'Test', NULL), (4, 'A', 1), (5, 'A', 2), (6, 'B', 5), (7, 'C', 2), (8, 'A', 3),
+                             (9, 'B', 8), (10, 'D', 9), (11, 'Other', NULL)""")
+        connector.commit()
+        connector.close()
+
+        self.directory_db = DirectoryTreeDB()
+        assert self.directory_db.cursor.execute("""PRAGMA user_version""").fetchone()[0] == SCHEMA_VERSION
+        DirectoryTree(self.directory_db).list_directories()
+        assert mock_stdout.getvalue() == "LIST\nOther\nTest\n  A\n    B\n      D\n  C\n"
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.directory_db.cursor.execute("""INSERT INTO DIRECTORY(folder_name, parent) VALUES ('Test', NULL)""")
+        with self.assertRaises(AssertionError):
+            self.directory_db.create_directory("Test", None)
+
     def test_create_directory(self):
         self.directory_db.create_table()
         self.directory_db.create_directory("Test", None)
@@ -147,6 +289,66 @@ class DtDbFunctionalityTest(unittest.TestCase):
             self.directory_db.delete_directory("Test", None)
         assert e.exception.args[0] == "Directory does not exist"
 
+    def test_iter_directory_tree(self):
+        self.directory_db.create_table()
+        self.directory_db.create_directory("b", None)
+        self.directory_db.create_directory("a", None)
+        self.directory_db.create_directory("z", 2)
+        self.directory_db.create_directory("c", 2)
+        self.directory_db.create_directory("x", 4)
+        self.directory_db.create_directory("a-c", None)
+        self.directory_db.create_directory("y", 1)
+
+        assert list(self.directory_db.iter_directory_tree()) == [
+            (0, "a"), (1, "c"), (2, "x"), (1, "z"), (0, "a-c"), (0, "b"), (1, "y")]
+
+    def test_iter_directory_tree_deep(self):
+        self.directory_db.create_table()
+        self.directory_db.autocommit = False
+        self.directory_db.create_directory("Test_0", None)
+        for level in range(1, 5000):
+            self.directory_db.create_directory(f"Test_{level}", level)
+        self.directory_db.flush()
+
+        tree = list(self.directory_db.iter_directory_tree())
+        assert len(tree) == 5000
+        assert tree[-1] == (4999, "Test_4999")
+
+    def test_concurrent_reads(self):
+        assert self.directory_db.concurrent_reads
+        assert self.directory_db.connector.execute("""PRAGMA journal_mode""").fetchone()[0] == "wal"
+        self.directory_db.create_directory("Test", None)
+        self.directory_db.autocommit = False
+        self.directory_db.create_directory("Test_2", 1)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            trees = list(executor.map(lambda _: list(self.directory_db.iter_directory_tree()), range(6)))
+            assert trees == [[(0, "Test")]] * 6
+            assert executor.submit(self.directory_db.get_directory, "Test", None).result().id == 1
+            assert not executor.submit(self.directory_db.get_directory, "Test_2", 1).result()
+        assert list(self.directory_db.iter_directory_tree()) == [(0, "Test"), (1, "Test_2")]
+
+        self.directory_db.flush()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(self.directory_db.get_directory, "Test_2", 1).result()
+        assert len(self.directory_db.connections.opened) <= 3
+
+    def test_delete_directory_tree(self):
+        self.directory_db.create_table()
+        self.directory_db.create_directory("Test", None)
+        self.directory_db.create_directory("Test_2", 1)
+        self.directory_db.create_directory("Test_3", 2)
+        self.directory_db.create_directory("Test_4", 1)
+        self.directory_db.create_directory("Test_5", None)
+
+        self.directory_db.delete_directory_tree(2)
+        rows = self.directory_db.cursor.execute("""SELECT folder_name FROM DIRECTORY ORDER BY id""").fetchall()
+        assert [row[0] for row in rows] == ["Test", "Test_4", "Test_5"]
+
+        self.directory_db.delete_directory("Test", None)
+        rows = self.directory_db.cursor.execute("""SELECT folder_name FROM DIRECTORY ORDER BY id""").fetchall()
+        assert [row[0] for row in rows] == ["Test_5"]
+
     def test_find_children_directories(self):
         self.directory_db.create_table()
         self.directory_db.create_directory("Test", None)
@@ -161,6 +363,17 @@ class DtDbFunctionalityTest(unittest.TestCase):
         children_directories = self.directory_db.find_children_directories(2)
         assert len(children_directories) == 3
 
+    def test_find_children_rows(self):
+        self.directory_db.create_table()
+        self.directory_db.create_directory("Test", None)
+        self.directory_db.create_directory("B", 1)
+        self.directory_db.create_directory("A", 1)
+        self.directory_db.create_directory("C", None)
+
+        assert self.directory_db.find_children_rows(None) == [(4, "C"), (1, "Test")]
+        assert self.directory_db.find_children_rows(1) == [(3, "A"), (2, "B")]
+        assert self.directory_db.find_children_rows(2) == []
+
     def test_update_directory_parent(self):
         self.directory_db.create_table()
         self.directory_db.create_directory("Test", None)
@@ -188,11 +401,15 @@ class DtFunctionalityTest(unittest.TestCase):
     def setUp(self):
         self.db_name = "test_directory_tree.db"
         os.environ["PYTEST_DIRECTORY_TREE"] = "True"
-        self.directory_tree = DirectoryTree()
+        self.directory_tree = self.create_directory_tree()
 
     def tearDown(self):
-        if os.path.exists(self.db_name):
-            os.remove(self.db_name)
+        close_quietly(self.directory_tree.close)
+        remove_database(self.db_name)
+
+    @staticmethod
+    def create_directory_tree():
+        return DirectoryTree()
 
     def __create_tree__(self):
         self.directory_tree.create_directory("Test")
@@ -232,6 +449,41 @@ Test
   Test_5"""
         assert list_result == expected_value
 
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_list_directory_options(self, mock_stdout):
+        self.__create_tree__()
+        self.directory_tree.create_directory("Test_6")
+        self.directory_tree.create_directory("Test_7")
+
+        self.directory_tree.list_directories("Test")
+        assert mock_stdout.getvalue().strip().split("LIST Test\n")[-1] == """Test_2
+  Test_3
+  Test_4
+Test_5"""
+
+        self.directory_tree.list_directories("depth=1")
+        assert mock_stdout.getvalue().strip().split("LIST depth=1\n")[-1] == """Test
+Test_6
+Test_7"""
+
+        self.directory_tree.list_directories("offset=1", "limit=1")
+        assert mock_stdout.getvalue().strip().split("LIST offset=1 limit=1\n")[-1] == "Test_6"
+
+        self.directory_tree.list_directories("Test/Test_2", "depth=1", "offset=1")
+        assert mock_stdout.getvalue().strip().split("LIST Test/Test_2 depth=1 offset=1\n")[-1] == "Test_4"
+
+        self.directory_tree.list_directories("Test", "depth=2", "limit=1")
+        assert mock_stdout.getvalue().strip().split("LIST Test depth=2 limit=1\n")[-1] == """Test_2
+  Test_3
+  Test_4"""
+
+        self.directory_tree.list_directories("Test/Test_9")
+        assert "Cannot list Test/Test_9 - Test_9 does not exist" in mock_stdout.getvalue()
+        self.directory_tree.list_directories("Test_1/Test_2")
+        assert "Cannot list Test_1/Test_2 - Test_1 does not exist" in mock_stdout.getvalue()
+        self.directory_tree.list_directories("Test", "depth=x")
+        assert "Cannot list - invalid option depth=x" in mock_stdout.getvalue()
+
     @unittest.mock.patch('sys.stdout', new_callable=StringIO)
     def test_delete_directory(self, mock_stdout):
         self.__create_tree__()
@@ -286,6 +538,708 @@ Test
         self.directory_tree.move_directory("Test/Test_2/Test_3", "Test_1")
         assert "Cannot move Test/Test_2/Test_3 - Test_1 does not exist" in mock_stdout.getvalue()
 
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_move_directory_into_descendant(self, mock_stdout):
+        self.__create_tree__()
+
+        self.directory_tree.move_directory("Test/Test_2", "Test/Test_2/Test_3")
+        assert "Cannot move Test/Test_2 - Test/Test_2/Test_3 is inside Test/Test_2" in mock_stdout.getvalue()
+        self.directory_tree.move_directory("Test", "Test")
+        assert "Cannot move Test - Test is inside Test" in mock_stdout.getvalue()
+
+        assert self.directory_tree.database.is_descendant(4, 1)
+        assert not self.directory_tree.database.is_descendant(1, 4)
+        assert not self.directory_tree.database.is_descendant(2, 3)
+
+        self.directory_tree.list_directories()
+        list_result = mock_stdout.getvalue().strip().split("LIST")[-1]
+        assert list_result == """
+Test
+  Test_2
+    Test_3
+    Test_4
+  Test_5"""
+
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_path_cache_invalidation(self, mock_stdout):
+        self.__create_tree__()
+        self.directory_tree.create_directory("Test/Test_2/Test_3/Test_6")
+        self.directory_tree.create_directory("Test/Test_2/Test_3/Test_7")
+        assert self.directory_tree.path_cache.hits == 3
+        assert "Test/Test_2/Test_3" in self.directory_tree.path_cache.entries
+
+        self.directory_tree.move_directory("Test/Test_2", "Test/Test_5")
+        assert "Test/Test_2" not in self.directory_tree.path_cache.entries
+        assert "Test/Test_2/Test_3" not in self.directory_tree.path_cache.entries
+        assert "Test" in self.directory_tree.path_cache.entries
+
+        self.directory_tree.create_directory("Test/Test_2/Test_3/Test_8")
+        assert "Test_2 does not exist" in mock_stdout.getvalue()
+        self.directory_tree.create_directory("Test/Test_5/Test_2/Test_3/Test_8")
+        assert (dir_model := self.directory_tree.database.get_directory("Test_8", 4))
+        assert dir_model.name == "Test_8"
+
+        self.directory_tree.delete_directory("Test/Test_5/Test_2")
+        assert not [path for path in self.directory_tree.path_cache.entries if path.startswith("Test/Test_5/Test_2")]
+        self.directory_tree.delete_directory("Test/Test_5/Test_2/Test_3")
+        assert "Cannot delete Test/Test_5/Test_2/Test_3 - Test_2 does not exist" in mock_stdout.getvalue()
+
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_resolve_paths(self, mock_stdout):
+        self.__create_tree__()
+        database = self.directory_tree.database
+
+        paths = [["Test", "Test_2", "Test_3"], ["Test", "Test_2", "Test_4"], ["Test", "Missing", "Test_3"], ["Test"],
+                 ["Missing"], ["Test", "Test_5"], ["Test", "Test_2", "Test_3"]]
+        assert database.resolve_paths(paths) == [4, 5, None, 1, None, 2, 4]
+        assert database.resolve_paths([["Test_3"], ["Test_5"]], 3) == [4, None]
+        assert database.resolve_paths([]) == []
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_prefetch_directories(self, mock_stdout):
+        self.__create_tree__()
+        self.directory_tree.path_cache.clear()
+
+        self.directory_tree.prefetch_directories(["Test/Test_2/Test_3/X", "Test/Test_2/Y", "Missing/Z", "Root"])
+        assert "Test/Test_2/Test_3" in self.directory_tree.path_cache
+        assert "Test/Test_2" in self.directory_tree.path_cache
+        assert "Missing" not in self.directory_tree.path_cache
+        misses = self.directory_tree.path_cache.stats()["misses"]
+        self.directory_tree.create_directory("Test/Test_2/Test_3/X")
+        assert self.directory_tree.path_cache.stats()["misses"] == misses
+
+
+class DtMaterializedPathFunctionalityTest(DtFunctionalityTest):
+    @staticmethod
+    def create_directory_tree():
+        return DirectoryTree(DirectoryTreeDB(materialized_path=True))
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_paths(self, mock_stdout):
+        self.__create_tree__()
+        database = self.directory_tree.database
+        assert database.get_directory_path(4) == "Test/Test_2/Test_3"
+        assert database.resolve_directory(["Test", "Test_2", "Test_4"]) == 5
+        assert list(database.iter_directory_tree(3)) == [(0, "Test_3"), (0, "Test_4")]
+
+        self.directory_tree.move_directory("Test/Test_2", "Test/Test_5")
+        assert database.get_directory_path(3) == "Test/Test_5/Test_2"
+        assert database.get_directory_path(5) == "Test/Test_5/Test_2/Test_4"
+        with self.assertRaises(AssertionError) as e:
+            database.resolve_directory(["Test", "Test_2", "Test_4"])
+        assert e.exception.args[0] == "Test_2"
+
+        self.directory_tree.delete_directory("Test/Test_5")
+        assert list(database.iter_directory_tree(1)) == []
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_list_subtree_by_path(self, mock_stdout):
+        for path in ["Test", "Test/a", "Test/a-b", "Test/a.b", "Test/a/x", "Test/a!", "Test/a/x/y"]:
+            self.directory_tree.create_directory(path)
+        database = self.directory_tree.database
+
+        assert list(database.iter_directory_tree(1)) == [(0, "a"), (1, "x"), (2, "y"), (0, "a!"), (0, "a-b"),
+                                                         (0, "a.b")]
+        assert list(database.iter_directory_tree(1, max_depth=2)) == [(0, "a"), (1, "x"), (0, "a!"), (0, "a-b"),
+                                                                      (0, "a.b")]
+
+    def test_migrate_to_materialized_path(self):
+        self.directory_tree.close()
+        os.remove(self.db_name)
+        database = DirectoryTreeDB()
+        database.create_directory("Test", None)
+        database.create_directory("Test_2", 1)
+        database.create_directory("Test_3", 2)
+        database.close_db()
+
+        database = DirectoryTreeDB(materialized_path=True)
+        assert database.get_directory_path(3) == "Test/Test_2/Test_3"
+        database.close_db()
+        database = DirectoryTreeDB()
+        assert database.materialized_path
+        database.close_db()
+
+
+class DtMemoryFunctionalityTest(DtFunctionalityTest):
+    def setUp(self):
+        self.directory_tree = DirectoryTree(DirectoryTreeMemory())
+
+    def tearDown(self):
+        pass
+
+
+class CommandParserTest(unittest.TestCase):
+    def test_parse_line(self):
+        assert parse_line(1, "  ") is None
+        assert parse_line(2, "MOVE a b\n") == ParsedCommand(2, "MOVE", ("a", "b"))
+        assert parse_line(3, "LIST") == ParsedCommand(3, "LIST", ())
+        assert parse_line(4, "list") == InvalidCommand(4, "list", "Unknown command list")
+        assert parse_line(5, "DELETE a b") == InvalidCommand(5, "DELETE a b", "DELETE expects 1 argument(s)")
+
+    def test_parse_commands_in_order(self):
+        lines = (f"CREATE folder_{line}" if line % 7 else "BAD" for line in range(1, 1001))
+        inline = list(parse_commands(lines))
+        parallel = list(parse_commands((f"CREATE folder_{line}" if line % 7 else "BAD" for line in range(1, 1001)),
+                                       workers=2, chunk_size=50))
+        assert inline == parallel
+        assert [command.line_number for command in parallel] == list(range(1, 1001))
+        assert sum(isinstance(command, InvalidCommand) for command in parallel) == 142
+
+
+class ModelTest(unittest.TestCase):
+    def test_slots(self):
+        directory_model = DirectoryModel.from_db((1, "Test", None))
+        tree_model = DirectoryTreeModel("Test")
+        assert not hasattr(directory_model, "__dict__")
+        assert not hasattr(tree_model, "__dict__")
+        assert directory_model == DirectoryModel(id=1, name="Test", parent=None)
+        assert sorted([DirectoryTreeModel("b"), tree_model, DirectoryTreeModel("a")])[0].value == "Test"
+
+
+class ListingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.db_name = "test_directory_tree.db"
+        os.environ["PYTEST_DIRECTORY_TREE"] = "True"
+
+    def tearDown(self):
+        remove_database(self.db_name)
+
+    def test_matches_full_listing(self):
+        commands = list(generate_random_mix(3000, seed=7, list_ratio=0.05))
+        outputs = []
+        for incremental_list in (False, True):
+            directory_tree = DirectoryTree(DirectoryTreeMemory(), incremental_list=incremental_list)
+            with unittest.mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+                replay(directory_tree, commands)
+            outputs.append(mock_stdout.getvalue())
+        assert outputs[0] == outputs[1]
+        assert outputs[0].count("LIST") > 50
+
+    def test_matches_sqlite_output(self):
+        for seed in (1, 3, 5):
+            commands = list(generate_random_mix(3000, seed=seed, move_ratio=0.2, list_ratio=0.01))
+            commands += ["CREATE a", "CREATE a/x", "CREATE b", "CREATE b/x", "MOVE a/x a", "MOVE a/x b", "LIST"]
+            outputs = []
+            for database in (DirectoryTreeDB(":memory:"), DirectoryTreeMemory()):
+                directory_tree = DirectoryTree(database)
+                with unittest.mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+                    replay(directory_tree, commands)
+                outputs.append(mock_stdout.getvalue())
+                directory_tree.close()
+            assert outputs[0] == outputs[1]
+            assert ("MOVE a/x a\nMOVE a/x b\nError updating directory:  UNIQUE constraint failed: "
+                    "DIRECTORY.folder_name, DIRECTORY.parent\nLIST\n") in outputs[0]
+
+    def test_delete_after_move(self):
+        commands = ["CREATE x", "CREATE r", "CREATE r/y", "CREATE r/y/k", "LIST", "MOVE r/y x", "DELETE x",
+                    "CREATE r/z", "LIST"]
+        outputs = []
+        for incremental_list in (False, True):
+            directory_tree = DirectoryTree(DirectoryTreeDB(":memory:"), incremental_list=incremental_list)
+            with unittest.mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+                replay(directory_tree, commands)
+            outputs.append(mock_stdout.getvalue())
+            directory_tree.close()
+        assert outputs[0] == outputs[1]
+        assert outputs[1].endswith("CREATE r/z\nLIST\nr\n  z\n")
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_relists_only_dirty_branch(self, mock_stdout):
+        directory_tree = DirectoryTree(incremental_list=True)
+        for root in range(20):
+            directory_tree.create_directory(f"Test_{root}")
+            for child in range(5):
+                directory_tree.create_directory(f"Test_{root}/Test_{child}")
+        directory_tree.list_directories()
+
+        queries = []
+        directory_tree.database.connector.set_trace_callback(queries.append)
+        directory_tree.list_directories()
+        assert queries == []
+
+        directory_tree.create_directory("Test_3/Test_4/Test_9")
+        queries.clear()
+        directory_tree.list_directories()
+        assert len(queries) == 4
+        assert "    Test_9" in mock_stdout.getvalue().split("LIST")[-1]
+
+        directory_tree.delete_directory("Test_3/Test_4")
+        directory_tree.move_directory("Test_5", "Test_3")
+        directory_tree.list_directories()
+        list_result = mock_stdout.getvalue().split("LIST")[-1]
+        assert "Test_3\n  Test_0\n  Test_1\n  Test_2\n  Test_3\n  Test_5\n    Test_0\n" in list_result
+        assert "    Test_9" not in list_result
+        directory_tree.close()
+
+
+class DtMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.snapshot_path = "test_directory_tree.snapshot"
+        self.log_path = "test_directory_tree.log"
+
+    def tearDown(self):
+        for path in (self.snapshot_path, self.log_path, f"{self.log_path}.snapshot"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_iter_directory_tree(self, mock_stdout):
+        database = DirectoryTreeMemory()
+        database.create_directory("b", None)
+        database.create_directory("a", None)
+        database.create_directory("z", 2)
+        database.create_directory("c", 2)
+        for level in range(5000):
+            database.create_directory(f"Test_{level}", 4 + level)
+
+        tree = list(database.iter_directory_tree())
+        assert tree[:3] == [(0, "a"), (1, "c"), (2, "Test_0")]
+        assert tree[-3:] == [(5001, "Test_4999"), (1, "z"), (0, "b")]
+
+    def test_find_children_rows(self):
+        database = DirectoryTreeMemory()
+        database.create_directory("Test", None)
+        database.create_directory("B", 1)
+        database.create_directory("A", 1)
+
+        assert database.find_children_rows(None) == [(1, "Test")]
+        assert database.find_children_rows(1) == [(3, "A"), (2, "B")]
+        assert database.find_children_rows(5) == []
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_snapshot_restore(self, mock_stdout):
+        directory_tree = DirectoryTree(DirectoryTreeMemory(snapshot_path=self.snapshot_path))
+        directory_tree.create_directory("Test")
+        directory_tree.create_directory("Test/Test_2")
+        directory_tree.create_directory("Test/Test_2/Test_3")
+        directory_tree.create_directory("Test_4")
+        directory_tree.delete_directory("Test_4")
+        directory_tree.close()
+
+        database = DirectoryTreeMemory(snapshot_path=self.snapshot_path)
+        assert (dir_model := database.get_directory("Test_3", 2))
+        assert dir_model.id == 3
+        assert not database.get_directory("Test_4", None)
+        assert database.next_id == 5
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_log_recovery(self, mock_stdout):
+        database = DirectoryTreeMemory(log_path=self.log_path, group_size=1000)
+        directory_tree = DirectoryTree(database)
+        for command in ["CREATE A", "CREATE A/B", "CREATE A/B/C", "CREATE D", "MOVE A/B D", "CREATE E", "DELETE E"]:
+            directory_tree.handlers[command.split()[0]](*command.split()[1:])
+        database.flush()
+        expected = list(database.iter_directory_tree())
+
+        # No close: only the log is on disk, as after a crash.
+        recovered = DirectoryTreeMemory(log_path=self.log_path)
+        assert list(recovered.iter_directory_tree()) == expected == [(0, "A"), (0, "D"), (1, "B"), (2, "C")]
+        assert recovered.lsn == 7
+        assert recovered.next_id == 6
+        recovered.log.close()
+        database.log.close()
+
+    def test_log_compaction(self):
+        database = DirectoryTreeMemory(log_path=self.log_path, snapshot_every=5)
+        database.create_directory("Test", None)
+        for index in range(11):
+            database.create_directory(f"Test_{index}", 1)
+        database.flush()
+
+        assert os.path.exists(f"{self.log_path}.snapshot")
+        assert database.log.records == 2
+
+        recovered = DirectoryTreeMemory(log_path=self.log_path)
+        assert recovered.log.records == 2
+        assert list(recovered.iter_directory_tree()) == list(database.iter_directory_tree())
+        recovered.close_db()
+        assert os.path.getsize(self.log_path) == 0
+        database.log.close()
+
+    def test_log_torn_tail(self):
+        database = DirectoryTreeMemory(log_path=self.log_path)
+        database.create_directory("Test", None)
+        database.create_directory("Test_2", 1)
+        database.log.close()
+        with open(self.log_path, "ab") as f:
+            f.write(b"\x20\x00\x00\x00partial")
+
+        recovered = DirectoryTreeMemory(log_path=self.log_path)
+        assert list(recovered.iter_directory_tree()) == [(0, "Test"), (1, "Test_2")]
+        recovered.create_directory("Test_3", None)
+        recovered.log.close()
+
+        reopened = DirectoryTreeMemory(log_path=self.log_path)
+        assert list(reopened.iter_directory_tree())[-1] == (0, "Test_3")
+        reopened.log.close()
+
+
+class PathCacheTest(unittest.TestCase):
+    def test_find(self):
+        path_cache = PathCache()
+        path_cache.put("a", 1)
+        path_cache.put("a/b", 2)
+
+        assert path_cache.find(["a", "b", "c"]) == (2, 2)
+        assert path_cache.find(["a", "b"]) == (2, 2)
+        assert path_cache.find(["x"]) == (0, None)
+        assert path_cache.find([]) == (0, None)
+        assert path_cache.stats() == {"hits": 1, "misses": 2, "size": 2}
+
+    def test_lru_eviction(self):
+        path_cache = PathCache(max_size=2)
+        path_cache.put("a", 1)
+        path_cache.put("b", 2)
+        path_cache.find(["a"])
+        path_cache.put("c", 3)
+
+        assert list(path_cache.entries) == ["a", "c"]
+
+    def test_invalidate(self):
+        path_cache = PathCache()
+        path_cache.put("a", 1)
+        path_cache.put("a/b", 2)
+        path_cache.put("a/b/c", 3)
+        path_cache.put("a/bc", 4)
+
+        path_cache.invalidate("a/b")
+        assert list(path_cache.entries) == ["a", "a/bc"]
+
+    def test_prefix_index(self):
+        path_cache = PathCache(max_size=2)
+        path_cache.put("a/b/c", 3)
+        path_cache.put("a/b/d", 4)
+        path_cache.invalidate("a/b")
+        assert list(path_cache.entries) == []
+        assert path_cache.children == {"": set()}
+
+        path_cache.put("a/b/c", 3)
+        path_cache.put("x", 5)
+        path_cache.put("y", 6)
+        assert list(path_cache.entries) == ["x", "y"]
+        assert path_cache.children == {"": {"x", "y"}, "x": set(), "y": set()}
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_caches_every_prefix(self, mock_stdout):
+        directory_tree = DirectoryTree(DirectoryTreeMemory())
+        for path in ["a", "a/b", "a/b/c", "a/b/c/d"]:
+            directory_tree.create_directory(path)
+        directory_tree.path_cache.clear()
+
+        directory_tree.create_directory("a/b/c/d/e")
+        assert list(directory_tree.path_cache.entries) == ["a", "a/b", "a/b/c", "a/b/c/d"]
+        directory_tree.create_directory("a/b/x")
+        assert directory_tree.path_cache.stats()["hits"] == 1
+        directory_tree.create_directory("a/y/z")
+        assert "does not exist" in mock_stdout.getvalue()
+
+
+class BulkImportTest(unittest.TestCase):
+    def setUp(self):
+        self.db_name = "test_directory_tree.db"
+        os.environ["PYTEST_DIRECTORY_TREE"] = "True"
+
+    def tearDown(self):
+        remove_database(self.db_name)
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_import_paths(self, mock_stdout):
+        directory_tree = DirectoryTree()
+        directory_tree.create_directory("fruits")
+        directory_tree.create_directory("fruits/apples")
+
+        paths = read_path_list(["fruits/apples/fuji/", "/vegetables/squash", "", "fruits/apples", "grains",
+                                "vegetables/squash"])
+        assert import_paths(directory_tree.database, paths) == 4
+
+        directory_tree.list_directories()
+        assert mock_stdout.getvalue().strip().split("LIST")[-1] == """
+fruits
+  apples
+    fuji
+grains
+vegetables
+  squash"""
+        directory_tree.create_directory("vegetables/squash/butternut")
+        assert "does not exist" not in mock_stdout.getvalue()
+        directory_tree.close()
+
+    def test_import_failure_is_atomic(self):
+        database = DirectoryTreeDB()
+        database.create_directory("fruits", None)
+        with unittest.mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            assert database.insert_directories([(2, "apples", 1), (3, "fruits", None)]) == 0
+        assert "Error inserting directories" in mock_stdout.getvalue()
+        assert database.next_directory_id() == 2
+        with unittest.mock.patch.object(database, "insert_directories", return_value=0):
+            assert import_paths(database, ["fruits/apples", "grains"]) == 0
+        database.close_db()
+
+    def test_memory_import_failure_is_atomic(self):
+        database = DirectoryTreeMemory()
+        database.create_directory("fruits", None)
+        with unittest.mock.patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            assert database.insert_directories([(2, "apples", 1), (3, "fuji", 2), (4, "fruits", None)]) == 0
+        assert "Error inserting directories" in mock_stdout.getvalue()
+        assert list(database.iter_directory_tree()) == [(0, "fruits")]
+        assert database.next_directory_id() == 2
+        assert database.insert_directories([(2, "apples", 1)]) == 1
+
+    def test_walk_directory(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, "fruits", "apples", "fuji"))
+            os.makedirs(os.path.join(root, "grains"))
+            open(os.path.join(root, "grains", "rice.txt"), "w").close()
+
+            assert sorted(walk_directory(root)) == ["fruits", "fruits/apples", "fruits/apples/fuji", "grains"]
+
+            database = DirectoryTreeMemory()
+            assert import_paths(database, walk_directory(root)) == 4
+            assert list(database.iter_directory_tree()) == [(0, "fruits"), (1, "apples"), (2, "fuji"), (0, "grains")]
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.db_name = "test_directory_tree.db"
+        os.environ["PYTEST_DIRECTORY_TREE"] = "True"
+
+    def tearDown(self):
+        remove_database(self.db_name)
+
+    @staticmethod
+    async def read_responses(reader, count):
+        responses = []
+        for _ in range(count):
+            lines = []
+            while (line := (await reader.readline()).decode().rstrip("\n")) != "":
+                lines.append(line)
+            responses.append(lines)
+        return responses
+
+    async def pipelined_session(self, socket_path):
+        directory_tree = DirectoryTree()
+        directory_tree_server = DirectoryTreeServer(directory_tree)
+        server = await directory_tree_server.start(socket_path=socket_path)
+        first_reader, first_writer = await asyncio.open_unix_connection(socket_path)
+        second_reader, second_writer = await asyncio.open_unix_connection(socket_path)
+
+        first_writer.write(b"CREATE fruits\nCREATE fruits/apples\nLIST\nRENAME fruits\n")
+        second_writer.write(b"CREATE grains\nLIST\n")
+        first_responses = await self.read_responses(first_reader, 4)
+        second_responses = await self.read_responses(second_reader, 2)
+        first_writer.write(b"LIST\n")
+        last_list = await self.read_responses(first_reader, 1)
+
+        for writer in (first_writer, second_writer):
+            writer.close()
+            await writer.wait_closed()
+        await directory_tree_server.stop(server)
+        directory_tree.close()
+        return first_responses, second_responses, last_list
+
+    def test_pipelined_clients(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first, second, last_list = asyncio.run(self.pipelined_session(os.path.join(directory, "tree.sock")))
+
+        assert first[:2] == [["CREATE fruits"], ["CREATE fruits/apples"]]
+        assert first[2][:3] == ["LIST", "fruits", "  apples"]
+        assert first[3] == ["Unknown command RENAME"]
+        assert second[0] == ["CREATE grains"]
+        assert "grains" in second[1]
+        assert last_list == [["LIST", "fruits", "  apples", "grains"]]
+
+    async def list_then_create_session(self, socket_path):
+        directory_tree = DirectoryTree()
+        assert directory_tree.database.concurrent_reads
+        directory_tree.database.insert_directories([(1, "Test", None)] +
+                                                   [(2 + index, f"Test_{index}", 1) for index in range(30000)])
+        directory_tree.database.flush()
+        directory_tree_server = DirectoryTreeServer(directory_tree)
+        server = await directory_tree_server.start(socket_path=socket_path)
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+
+        writer.write(b"CREATE Test/Test_0/Test\nLIST\nCREATE zzz\nLIST\n")
+        responses = await self.read_responses(reader, 4)
+
+        writer.close()
+        await writer.wait_closed()
+        await directory_tree_server.stop(server)
+        directory_tree.close()
+        return responses
+
+    async def stop_with_open_client(self, socket_path):
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        directory_tree = DirectoryTree()
+        directory_tree_server = DirectoryTreeServer(directory_tree)
+        server = await directory_tree_server.start(socket_path=socket_path)
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write(b"CREATE fruits\n")
+        responses = await self.read_responses(reader, 1)
+
+        await directory_tree_server.stop(server)
+        closed = await reader.read()
+        directory_tree.close()
+        writer.close()
+        return responses, closed, errors
+
+    def test_stop_closes_clients(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertNoLogs("asyncio", level="ERROR"):
+                responses, closed, errors = asyncio.run(self.stop_with_open_client(os.path.join(directory, "tree.sock")))
+
+        assert responses == [["CREATE fruits"]]
+        assert closed == b""
+        assert errors == []
+
+    def test_list_ignores_later_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            responses = asyncio.run(self.list_then_create_session(os.path.join(directory, "tree.sock")))
+
+        assert "    Test" in responses[1]
+        assert "zzz" not in responses[1]
+        assert responses[2] == ["CREATE zzz"]
+        assert responses[3][-1] == "zzz"
+
+
+class ShardingTest(unittest.TestCase):
+    def setUp(self):
+        self.db_name = "test_directory_tree.db"
+        self.db_prefix = "test_directory_tree"
+        self.shards = 3
+
+    def tearDown(self):
+        remove_database(self.db_name)
+        for index in range(self.shards):
+            remove_database(f"{self.db_prefix}.shard{index}.db")
+
+    def replay_sharded(self, lines):
+        output = StringIO()
+        coordinator = ShardCoordinator(self.shards, self.db_prefix, batch_size=16)
+        with unittest.mock.patch('sys.stdout', output):
+            replay_sharded(coordinator, lines)
+        coordinator.close()
+        return coordinator, output.getvalue()
+
+    def test_same_output_as_serial(self):
+        lines = list(generate_random_mix(2000, seed=5, list_ratio=0.01))
+        lines += ["LIST", "LIST depth=2 offset=1 limit=3", "LIST depth=x"]
+        serial_output = StringIO()
+        with unittest.mock.patch('sys.stdout', serial_output):
+            directory_tree = DirectoryTree(DirectoryTreeDB(self.db_name))
+            replay(directory_tree, lines)
+            directory_tree.close()
+
+        coordinator, output = self.replay_sharded(lines)
+        assert output == serial_output.getvalue()
+        assert len(set(coordinator.shard_of(line.split()[1]) for line in lines if line.startswith("CREATE"))) == 3
+
+    def test_move_between_shards(self):
+        coordinator = ShardCoordinator(self.shards, self.db_prefix)
+        first = "Test_0"
+        second = next(f"Test_{index}" for index in range(1, 100)
+                      if coordinator.shard_of(f"Test_{index}") != coordinator.shard_of(first))
+        coordinator.close()
+
+        _, output = self.replay_sharded([
+            f"CREATE {first}", f"CREATE {first}/A", f"CREATE {first}/A/B", f"CREATE {first}/A/C", f"CREATE {second}",
+            f"CREATE {second}/A", f"MOVE {first}/A {second}", f"MOVE {first}/X/A {second}", f"MOVE {first}/A Test_X",
+            f"MOVE {first}/Y {second}", f"DELETE {second}/A", f"MOVE {first}/A {second}", f"CREATE {second}/A/B/D",
+            "LIST"])
+        assert f"MOVE {first}/A {second}\nError updating directory:  UNIQUE constraint failed" in output
+        assert f"MOVE {first}/X/A {second}\nCannot move {first}/X/A - X does not exist\n" in output
+        assert f"MOVE {first}/A Test_X\nCannot move {first}/A - Test_X does not exist\n" in output
+        assert f"MOVE {first}/Y {second}\nDELETE" in output
+        assert f"CREATE {second}/A/B/D\nLIST\n{first}\n{second}\n  A\n    B\n      D\n    C\n" in output
+
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.db_name = "test_directory_tree.db"
+        os.environ["PYTEST_DIRECTORY_TREE"] = "True"
+
+    def tearDown(self):
+        remove_database(self.db_name)
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_instrumented_commands(self, mock_stdout):
+        directory_tree = DirectoryTree()
+        handlers = dict(directory_tree.handlers)
+        summary_output = StringIO()
+        instrumentation = Instrumentation(directory_tree, output=summary_output).install()
+        assert isinstance(directory_tree.database.cursor, TimedCursor)
+
+        replay(directory_tree, ["CREATE Test", "CREATE Test/Test_2", "LIST", "MOVE Test/Test_2 Test", "DELETE Test"])
+        summary = instrumentation.summary()
+        assert summary["commands"]["CREATE"]["count"] == 2
+        assert summary["commands"]["LIST"]["queries"] == 1
+        assert summary["queries"] >= sum(command["queries"] for command in summary["commands"].values())
+        assert any(query.startswith("INSERT INTO DIRECTORY") for query in summary["statements"])
+
+        instrumentation.uninstall()
+        assert directory_tree.handlers == handlers
+        assert directory_tree.instrumentation is None
+        assert not isinstance(directory_tree.database.cursor, TimedCursor)
+
+        instrumentation.install()
+        directory_tree.close()
+        assert '"CREATE"' in summary_output.getvalue()
+
+    @unittest.mock.patch('sys.stdout', new_callable=StringIO)
+    def test_list_statement_timed(self, mock_stdout):
+        summary_output = StringIO()
+        for materialized_path in (False, True):
+            directory_tree = DirectoryTree(DirectoryTreeDB(":memory:", materialized_path=materialized_path))
+            instrumentation = Instrumentation(directory_tree, output=summary_output).install()
+            replay(directory_tree, ["CREATE Test", "CREATE Test/Test_2", "LIST", "LIST Test"])
+            instrumentation.dump()
+            statements = json.loads(summary_output.getvalue())["statements"]
+            assert any(query.startswith("WITH RECURSIVE TREE") for query in statements)
+            if materialized_path:
+                assert any("ORDER BY replace(path" in query for query in statements)
+            instrumentation.uninstall()
+            assert "open_cursor" not in vars(directory_tree.database)
+            directory_tree.close()
+            summary_output.truncate(0)
+            summary_output.seek(0)
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram()
+        for _ in range(99):
+            histogram.add(0.000010)
+        histogram.add(0.5)
+
+        assert histogram.count == 100
+        assert histogram.percentile(0.5) == 0.000016
+        assert histogram.percentile(1.0) == 0.5
+
+        exact = LatencyHistogram(samples=True)
+        for latency in (0.000010, 0.000013, 0.000011, 0.5):
+            exact.add(latency)
+        assert exact.percentile(0.5) == 0.000011
+        assert exact.percentile(1.0) == 0.5
+        assert exact.summary()["histogram_us"] == {"<16": 3, "<524288": 1}
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_generators(self):
+        assert list(generate_wide_tree(2)) == ["CREATE root_0", "CREATE root_0/folder_0", "CREATE root_0/folder_1", "LIST"]
+        assert list(generate_deep_chain(3)) == ["CREATE level_0", "CREATE level_0/level_1",
+                                                "CREATE level_0/level_1/level_2", "LIST"]
+        assert list(generate_random_mix(500, seed=3)) == list(generate_random_mix(500, seed=3))
+        assert len(list(generate_random_mix(500))) == 500
+
+    def test_run_benchmark(self):
+        report = run_benchmark(generate_random_mix(500, seed=1), DirectoryTreeDB(":memory:"), batch_size=100)
+        assert report["operations"] == 500
+        assert report["queries"] > 0
+        assert report["commands"]["CREATE"]["count"] > 0
+        assert report["commands"]["CREATE"]["p50_ms"] <= report["commands"]["CREATE"]["p99_ms"]
+        assert report["peak_rss_kb"] > 0
+        assert report["queries"] >= sum(command["queries"] for command in report["commands"].values())
+        assert any(query.startswith("INSERT") for query in report["statements"])
 
 
 if __name__ == '__main__':